@@ -1,12 +1,14 @@
 import re
 from os.path import dirname, join
 
+from .macros.cache import LRUCache
 from .macros.web import format_slug
 
 
 PACKAGE_FOLDER = dirname(__file__)
 TEMPLATES_FOLDER = join(PACKAGE_FOLDER, 'templates')
 ID_LENGTH = 16
+BATCH_CHUNK_ROW_COUNT = 4096
 
 
 AUTOMATION_NAME = 'Automation X'
@@ -16,6 +18,11 @@ AUTOMATION_PATH = 'automate.yml'
 
 HOST = '127.0.0.1'
 PORT = 7000
+SERVER_THREAD_COUNT = 32
+# Leave threads for pages and variables when many streams are open
+SERVER_STREAM_COUNT = SERVER_THREAD_COUNT // 2
+SERVER_BACKENDS = 'waitress', 'uvicorn'
+SERVER_BACKEND = SERVER_BACKENDS[0]
 DISK_POLL_IN_MILLISECONDS = 1000
 DISK_DEBOUNCE_IN_MILLISECONDS = 1000
 
@@ -31,7 +38,14 @@ STREAMS_ROUTE = '/streams'
 
 MODE_NAMES = 'input', 'output', 'log', 'debug'
 MODE_NAME_BY_CODE = {_[0]: _ for _ in MODE_NAMES}
-STREAM_PING_INTERVAL_IN_SECONDS = 1
+STREAM_PING_INTERVAL_IN_SECONDS = 15
+STREAM_RETRY_IN_MILLISECONDS = 10000
+PAGE_SIZE = 100
+MAXIMUM_PAGE_SIZE = 1000
+BATCH_SORT_KEYS = '', 'name', '-name'
+RUN_SORT_KEYS = '', '-time', 'time', 'name', '-name'
+RUN_REGISTRY_NAME = 'registry.sqlite'
+RUN_REGISTRY_TIMEOUT_IN_SECONDS = 30
 
 
 FUNCTION_BY_NAME = {
@@ -39,4 +53,10 @@ FUNCTION_BY_NAME = {
     'title': str.title,
 }
 VARIABLE_ID_PATTERN = re.compile(r'{\s*([^}]+?)\s*}')
-VARIABLE_CACHE = {}
+VARIABLE_CACHE = LRUCache(
+    maximum_length=10000, maximum_size_in_bytes=256 * 1024 * 1024)
+TEMPLATE_CACHE = {}
+CONFIGURATION_CACHE = {}
+PAGE_CACHE = LRUCache(
+    maximum_length=256, maximum_size_in_bytes=64 * 1024 * 1024)
+FUNCTION_WORKER_BY_KEY = {}
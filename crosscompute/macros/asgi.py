@@ -0,0 +1,158 @@
+import asyncio
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+
+class AsynchronousApplication():
+    '''
+    Serve a WSGI application from an event loop, where the WSGI application
+    runs in a thread pool and handler_by_path supplies native ASGI handlers.
+    '''
+
+    def __init__(
+            self, wsgi_app, base_uri='', handler_by_path=None,
+            thread_count=None):
+        self.wsgi_app = wsgi_app
+        self.base_uri = base_uri
+        self.handler_by_path = handler_by_path or {}
+        self.executor = ThreadPoolExecutor(max_workers=thread_count)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return
+        path = scope['path']
+        base_uri = self.base_uri
+        if base_uri:
+            if path != base_uri and not path.startswith(base_uri + '/'):
+                await send_response(send, 404, b'Not Found')
+                return
+            path = path[len(base_uri):] or '/'
+        try:
+            handle = self.handler_by_path[path]
+        except KeyError:
+            await self.handle_wsgi(scope, receive, send, path)
+        else:
+            await handle(scope, receive, send)
+
+    async def handle_wsgi(self, scope, receive, send, path):
+        loop = asyncio.get_running_loop()
+        environ = get_environ(scope, await receive_body(
+            receive), self.base_uri, path)
+        response_pack = []
+
+        def start_response(status, headers, exc_info=None):
+            response_pack[:] = status, headers
+            return lambda _: None
+
+        app_iter = await loop.run_in_executor(
+            self.executor, self.wsgi_app, environ, start_response)
+        chunks = iter(app_iter)
+        try:
+            is_started = False
+            while True:
+                chunk = await loop.run_in_executor(
+                    self.executor, next, chunks, None)
+                if not is_started and response_pack:
+                    status, headers = response_pack
+                    await send({
+                        'type': 'http.response.start',
+                        'status': int(status.split(' ', 1)[0]),
+                        'headers': [(
+                            k.lower().encode('latin-1'),
+                            v.encode('latin-1'),
+                        ) for k, v in headers],
+                    })
+                    is_started = True
+                if chunk is None:
+                    break
+                if chunk:
+                    await send({
+                        'type': 'http.response.body',
+                        'body': chunk,
+                        'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            if hasattr(app_iter, 'close'):
+                await loop.run_in_executor(self.executor, app_iter.close)
+
+
+class LoopQueue():
+    'Let threads put items that coroutines in an event loop can get'
+
+    def __init__(self, loop):
+        self._loop = loop
+        self._queue = asyncio.Queue()
+
+    def put(self, item):
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, item)
+
+    async def get(self):
+        return await self._queue.get()
+
+
+def get_environ(scope, body, base_uri, path):
+    server_host, server_port = scope.get('server') or ('localhost', 80)
+    client_host = (scope.get('client') or ('', 0))[0]
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': base_uri,
+        'PATH_INFO': path.encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server_host,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': 'HTTP/' + scope.get('http_version', '1.1'),
+        'REMOTE_ADDR': client_host,
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for key, value in scope['headers']:
+        key = key.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if key in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            environ[key] = value
+            continue
+        key = 'HTTP_' + key
+        if key in environ:
+            value = environ[key] + ',' + value
+        environ[key] = value
+    return environ
+
+
+async def receive_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        if message['type'] != 'http.request':
+            break
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            break
+    return body
+
+
+async def wait_for_disconnect(receive):
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+
+
+async def send_response(send, status, body, headers=()):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': list(headers)})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+def serve_asynchronously(app, host, port):
+    import uvicorn
+    uvicorn.run(
+        app, host=host, port=int(port), lifespan='off', log_config=None,
+        access_log=False)
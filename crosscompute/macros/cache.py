@@ -0,0 +1,88 @@
+from collections import OrderedDict
+from sys import getsizeof
+from threading import Lock
+
+
+class LRUCache():
+    '''
+    Keep the most recently used values within a maximum length and an
+    optional maximum size in bytes, evicting the least recently used.
+    '''
+
+    def __init__(
+            self, maximum_length, maximum_size_in_bytes=None,
+            get_size=None):
+        self.maximum_length = maximum_length
+        self.maximum_size_in_bytes = maximum_size_in_bytes
+        self.get_size = get_size or estimate_size
+        self.size_in_bytes = 0
+        self.hit_count = 0
+        self.miss_count = 0
+        self._pack_by_key = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value, size_in_bytes = self._pack_by_key[key]
+            except KeyError:
+                self.miss_count += 1
+                return default
+            self._pack_by_key.move_to_end(key)
+            self.hit_count += 1
+        return value
+
+    def set(self, key, value):
+        size_in_bytes = self.get_size(
+            value) if self.maximum_size_in_bytes is not None else 0
+        with self._lock:
+            self._discard(key)
+            if self.maximum_size_in_bytes is not None and (
+                    size_in_bytes > self.maximum_size_in_bytes):
+                return
+            self._pack_by_key[key] = value, size_in_bytes
+            self.size_in_bytes += size_in_bytes
+            while self._is_full():
+                self._discard(next(iter(self._pack_by_key)))
+
+    def discard(self, key):
+        with self._lock:
+            self._discard(key)
+
+    def clear(self):
+        with self._lock:
+            self._pack_by_key.clear()
+            self.size_in_bytes = 0
+
+    def _is_full(self):
+        if len(self._pack_by_key) > self.maximum_length:
+            return True
+        maximum_size_in_bytes = self.maximum_size_in_bytes
+        if maximum_size_in_bytes is None:
+            return False
+        return self.size_in_bytes > maximum_size_in_bytes
+
+    def _discard(self, key):
+        try:
+            value, size_in_bytes = self._pack_by_key.pop(key)
+        except KeyError:
+            return
+        self.size_in_bytes -= size_in_bytes
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._pack_by_key
+
+    def __len__(self):
+        return len(self._pack_by_key)
+
+
+def estimate_size(value):
+    'Estimate memory used by a value, including items in containers'
+    size_in_bytes = getsizeof(value)
+    if isinstance(value, dict):
+        size_in_bytes += sum(estimate_size(k) + estimate_size(
+            v) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set)):
+        size_in_bytes += sum(estimate_size(_) for _ in value)
+    return size_in_bytes
@@ -0,0 +1,70 @@
+from hashlib import blake2b
+from os import scandir, stat, walk
+from os.path import getsize, join
+from shutil import rmtree
+from time import time
+
+
+def get_hash(texts, paths=(), chunk_size_in_bytes=1024 * 1024):
+    h = blake2b(digest_size=16)
+    for text in texts:
+        h.update(str(text).encode() + b'\0')
+    for path in paths:
+        try:
+            with open(path, 'rb') as f:
+                while chunk := f.read(chunk_size_in_bytes):
+                    h.update(chunk)
+        except OSError:
+            h.update(b'\1')
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+def get_path_fingerprint(path):
+    try:
+        path_stat = stat(path)
+    except OSError:
+        return path, None, None
+    return path, path_stat.st_mtime_ns, path_stat.st_size
+
+
+def get_folder_size(folder):
+    size_in_bytes = 0
+    for root_folder, folder_names, file_names in walk(folder):
+        for file_name in file_names:
+            try:
+                size_in_bytes += getsize(join(root_folder, file_name))
+            except OSError:
+                pass
+    return size_in_bytes
+
+
+def remove_old_folders(
+        parent_folder, maximum_age_in_seconds=None,
+        maximum_size_in_bytes=None, excluded_folders=()):
+    'Remove oldest subfolders until they satisfy the age and size limits'
+    try:
+        entries = sorted((
+            _ for _ in scandir(parent_folder)
+            if _.is_dir() and _.path not in excluded_folders
+        ), key=lambda _: _.stat().st_mtime)
+    except OSError:
+        return []
+    removed_folders = []
+
+    def remove(entry):
+        rmtree(entry.path, ignore_errors=True)
+        removed_folders.append(entry.path)
+
+    if maximum_age_in_seconds is not None:
+        minimum_time = time() - maximum_age_in_seconds
+        while entries and entries[0].stat().st_mtime < minimum_time:
+            remove(entries.pop(0))
+    if maximum_size_in_bytes is not None:
+        size_by_path = {_.path: get_folder_size(_.path) for _ in entries}
+        size_in_bytes = sum(size_by_path.values())
+        while entries and size_in_bytes > maximum_size_in_bytes:
+            entry = entries.pop(0)
+            size_in_bytes -= size_by_path[entry.path]
+            remove(entry)
+    return removed_folders
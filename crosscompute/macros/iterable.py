@@ -25,5 +25,16 @@ def find_item(items, key, value, normalize=lambda _: _, compare=operator.eq):
     return next(filter(is_match, items))
 
 
+def index_by(items, key, normalize=lambda _: _):
+    item_by_value = {}
+    for item in items:
+        try:
+            v = item[key]
+        except KeyError:
+            continue
+        item_by_value.setdefault(normalize(v), item)
+    return item_by_value
+
+
 def extend_uniquely(old_items, new_items):
     old_items.extend(_ for _ in new_items if _ not in old_items)
@@ -0,0 +1,53 @@
+import json
+import tokenize
+from io import StringIO
+
+
+def get_script_text(notebook_path):
+    'Join code cells into a script, disabling IPython magics and commands'
+    with open(notebook_path, 'rt') as notebook_file:
+        notebook = json.load(notebook_file)
+    texts = []
+    for cell in notebook.get('cells', []):
+        if cell.get('cell_type') != 'code':
+            continue
+        source = cell.get('source', '')
+        if not isinstance(source, str):
+            source = ''.join(source)
+        lines = source.splitlines()
+        if lines and lines[0].startswith('%%'):
+            lines = [disable_line(_) for _ in lines]
+        else:
+            lines = list(yield_code_lines(lines))
+        texts.append('\n'.join(lines))
+    return '\n\n'.join(texts) + '\n'
+
+
+def yield_code_lines(lines):
+    'Disable magics and commands only where they begin a statement'
+    statement_lines = []
+    for line in lines:
+        if not statement_lines and line.lstrip().startswith(('%', '!')):
+            line = disable_line(line)
+        statement_lines.append(line)
+        if is_complete('\n'.join(statement_lines)):
+            statement_lines = []
+        yield line
+
+
+def is_complete(text):
+    'Return False if the text ends inside brackets, a string or after \\'
+    try:
+        for _ in tokenize.generate_tokens(StringIO(text + '\n').readline):
+            pass
+    except tokenize.TokenError:
+        return False
+    except SyntaxError:
+        pass
+    return True
+
+
+def disable_line(line):
+    stripped_line = line.lstrip()
+    indentation = line[:len(line) - len(stripped_line)]
+    return f'{indentation}pass  # {stripped_line}'
@@ -1,6 +1,15 @@
+import os
+import signal
+import subprocess
+from functools import partial
 from logging import getLogger
 from multiprocessing import Process
 
+try:
+    import resource
+except ImportError:
+    resource = None
+
 
 class StoppableProcess(Process):
 
@@ -21,4 +30,42 @@ class StoppableProcess(Process):
             self.join(sigkill_timeout_in_seconds)
 
 
+def run_process(
+        command, timeout_in_seconds=None, limit_by_resource_name=None,
+        **kwargs):
+    '''
+    Run command in a new session and return its exit code, where
+    limit_by_resource_name sets rlimits such as RLIMIT_CPU and a timeout
+    kills the whole process group before raising subprocess.TimeoutExpired.
+    '''
+    if limit_by_resource_name and resource:
+        kwargs['preexec_fn'] = partial(
+            set_resource_limits, limit_by_resource_name)
+    process = subprocess.Popen(command, start_new_session=True, **kwargs)
+    try:
+        return process.wait(timeout_in_seconds)
+    except BaseException:
+        kill_process_group(process)
+        raise
+
+
+def set_resource_limits(limit_by_resource_name):
+    for resource_name, limit in limit_by_resource_name.items():
+        resource_code = getattr(resource, resource_name)
+        hard_limit = resource.getrlimit(resource_code)[1]
+        if hard_limit != resource.RLIM_INFINITY:
+            limit = min(limit, hard_limit)
+        resource.setrlimit(resource_code, (limit, limit))
+
+
+def kill_process_group(process):
+    L.debug('sending sigkill to process group %s', process.pid)
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (AttributeError, OSError):
+        # Windows has no process groups
+        process.kill()
+    process.wait()
+
+
 L = getLogger(__name__)
@@ -0,0 +1,26 @@
+import csv
+
+
+def yield_csv_row_packs(path, offset=0, encoding='utf-8'):
+    'Yield the byte offset and values of each csv record, starting at offset'
+    with open(path, 'rb') as file:
+        file.seek(offset)
+        position = [offset]
+
+        def yield_line():
+            for line in file:
+                position[0] += len(line)
+                yield line.decode(encoding)
+
+        row_offset = offset
+        for values in csv.reader(yield_line()):
+            yield row_offset, values
+            # A record spans several lines if a quoted value has newlines
+            row_offset = position[0]
+
+
+def load_csv_row(path, offset, encoding='utf-8'):
+    'Read the values of the record that starts at the byte offset'
+    for _, values in yield_csv_row_packs(path, offset, encoding):
+        return values
+    raise IndexError(f'no row at offset {offset}')
@@ -0,0 +1,179 @@
+import ctypes
+import ctypes.util
+import os
+import struct
+import sys
+from logging import getLogger
+from os.path import dirname, exists, join
+from select import select
+from time import sleep, time
+
+from .disk import get_path_fingerprint
+
+
+class PathWatcher():
+    'Yield sets of changed paths, checking only the paths given'
+
+    def __init__(
+            self, paths, poll_in_milliseconds, debounce_in_milliseconds):
+        self.poll_in_seconds = poll_in_milliseconds / 1000
+        self.debounce_in_seconds = debounce_in_milliseconds / 1000
+        self.set_paths(paths)
+
+    def set_paths(self, paths):
+        self.paths = set(paths)
+
+    def close(self):
+        pass
+
+
+class PollingWatcher(PathWatcher):
+
+    def set_paths(self, paths):
+        super().set_paths(paths)
+        self._fingerprint_by_path = {
+            _: get_path_fingerprint(_) for _ in self.paths}
+
+    def __iter__(self):
+        while True:
+            sleep(self.poll_in_seconds)
+            changed_paths = self._get_changed_paths()
+            if not changed_paths:
+                continue
+            while True:
+                sleep(self.debounce_in_seconds)
+                paths = self._get_changed_paths()
+                if not paths:
+                    break
+                changed_paths.update(paths)
+            yield changed_paths
+
+    def _get_changed_paths(self):
+        changed_paths = set()
+        fingerprint_by_path = self._fingerprint_by_path
+        for path in self.paths:
+            fingerprint = get_path_fingerprint(path)
+            if fingerprint != fingerprint_by_path.get(path):
+                fingerprint_by_path[path] = fingerprint
+                changed_paths.add(path)
+        return changed_paths
+
+
+class InotifyWatcher(PathWatcher):
+    '''
+    Watch the folders that contain the paths so that files replaced by
+    editors stay watched, then ignore events for other files in the folders.
+    '''
+
+    event_mask = (
+        0x00000002  # IN_MODIFY
+        | 0x00000008  # IN_CLOSE_WRITE
+        | 0x00000040  # IN_MOVED_FROM
+        | 0x00000080  # IN_MOVED_TO
+        | 0x00000100  # IN_CREATE
+        | 0x00000200)  # IN_DELETE
+    ignored_mask = 0x00008000  # IN_IGNORED
+    event_header = struct.Struct('iIII')
+
+    def __init__(self, *args, **kwargs):
+        self._libc = libc = load_libc()
+        self._descriptor = libc.inotify_init1(os.O_CLOEXEC)
+        if self._descriptor < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self._folder_by_watch = {}
+        self._watch_by_folder = {}
+        super().__init__(*args, **kwargs)
+
+    def set_paths(self, paths):
+        super().set_paths(paths)
+        folders = {dirname(_) for _ in self.paths}
+        for folder in set(self._watch_by_folder) - folders:
+            watch_descriptor = self._watch_by_folder.pop(folder)
+            self._folder_by_watch.pop(watch_descriptor, None)
+            self._libc.inotify_rm_watch(self._descriptor, watch_descriptor)
+        self._pending_folders = folders - set(self._watch_by_folder)
+        self._add_pending_folders()
+
+    def close(self):
+        os.close(self._descriptor)
+
+    def __iter__(self):
+        while True:
+            if not select([self._descriptor], [], [], self.poll_in_seconds)[0]:
+                if changed_paths := self._add_pending_folders():
+                    yield changed_paths
+                continue
+            changed_paths = self._read_changed_paths()
+            expiration_time = time() + self.debounce_in_seconds
+            while (timeout := expiration_time - time()) > 0:
+                if not select([self._descriptor], [], [], timeout)[0]:
+                    break
+                changed_paths.update(self._read_changed_paths())
+            if changed_paths:
+                yield changed_paths
+
+    def _add_pending_folders(self):
+        'Watch folders that appeared and return the paths that they contain'
+        folders = set()
+        for folder in list(self._pending_folders):
+            watch_descriptor = self._libc.inotify_add_watch(
+                self._descriptor, os.fsencode(folder), self.event_mask)
+            if watch_descriptor < 0:
+                # Try again later in case the folder does not exist yet
+                continue
+            self._pending_folders.discard(folder)
+            self._watch_by_folder[folder] = watch_descriptor
+            self._folder_by_watch[watch_descriptor] = folder
+            folders.add(folder)
+        return {
+            _ for _ in self.paths if dirname(_) in folders and exists(_)}
+
+    def _read_changed_paths(self):
+        changed_paths = set()
+        buffer = os.read(self._descriptor, 65536)
+        header_size = self.event_header.size
+        index = 0
+        while index < len(buffer):
+            watch_descriptor, mask, cookie, name_length = \
+                self.event_header.unpack_from(buffer, index)
+            index += header_size
+            name = buffer[index:index + name_length].rstrip(b'\0')
+            index += name_length
+            folder = self._folder_by_watch.get(watch_descriptor)
+            if folder is None:
+                continue
+            if mask & self.ignored_mask:
+                # The folder was removed, so watch it again when it returns
+                del self._folder_by_watch[watch_descriptor]
+                del self._watch_by_folder[folder]
+                self._pending_folders.add(folder)
+                continue
+            path = join(folder, os.fsdecode(name))
+            if path in self.paths:
+                changed_paths.add(path)
+        return changed_paths
+
+
+def get_watcher(paths, poll_in_milliseconds, debounce_in_milliseconds):
+    'Use inotify if available, otherwise poll'
+    if sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(
+                paths, poll_in_milliseconds, debounce_in_milliseconds)
+        except (AttributeError, OSError) as e:
+            L.debug('could not use inotify: %s', e)
+    return PollingWatcher(
+        paths, poll_in_milliseconds, debounce_in_milliseconds)
+
+
+def load_libc():
+    libc = ctypes.CDLL(
+        ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+    libc.inotify_init1.argtypes = [ctypes.c_int]
+    libc.inotify_add_watch.argtypes = [
+        ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    return libc
+
+
+L = getLogger(__name__)
@@ -1,8 +1,8 @@
+import re
 import socket
 import webbrowser
 from invisibleroads_macros_text import normalize_key
 from logging import getLogger
-from markdown import markdown
 from multiprocessing import Process
 from time import sleep
 from urllib.error import HTTPError, URLError
@@ -14,6 +14,7 @@ def format_slug(text):
 
 
 def get_html_from_markdown(text):
+    from markdown import markdown
     html = markdown(text)
     if '</p>\n<p>' not in html:
         html = html.removeprefix('<p>')
@@ -21,6 +22,10 @@ def get_html_from_markdown(text):
     return html
 
 
+def is_block_html(html):
+    return BLOCK_HTML_PATTERN.match(html) is not None
+
+
 def is_port_in_use(port):
     # https://stackoverflow.com/a/52872579
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
@@ -50,4 +55,7 @@ def open_browser(uri, check_interval_in_seconds=1):
     browser_process.start()
 
 
+BLOCK_HTML_PATTERN = re.compile(
+    r'\s*<(address|article|aside|blockquote|div|dl|fieldset|figure|footer|'
+    r'form|h[1-6]|header|hr|ol|p|pre|section|table|ul)\b', re.IGNORECASE)
 L = getLogger(__name__)
@@ -3,30 +3,49 @@
 # TODO: Add unit tests
 import json
 from invisibleroads_macros_disk import is_path_in_folder, make_random_folder
+from invisibleroads_macros_log import format_path
 from logging import getLogger
-from os.path import basename, exists, join, splitext
-from pyramid.httpexceptions import HTTPBadRequest, HTTPNotFound
+from math import ceil
+from os import makedirs, utime
+from os.path import basename, exists, getmtime, join, splitext
+from pyramid.httpexceptions import (
+    HTTPBadRequest, HTTPNotFound, HTTPNotModified)
+from pyramid.renderers import render
 from pyramid.response import FileResponse, Response
+from threading import Lock, Thread
+from urllib.parse import urlencode
 
 from ..constants import (
     AUTOMATION_ROUTE,
     BATCH_ROUTE,
+    BATCH_SORT_KEYS,
     ID_LENGTH,
+    MAXIMUM_PAGE_SIZE,
     MODE_NAME_BY_CODE,
     MODE_ROUTE,
+    PAGE_CACHE,
+    PAGE_SIZE,
     RUN_ROUTE,
+    RUN_SORT_KEYS,
     STYLE_ROUTE,
-    VARIABLE_ID_PATTERN,
     VARIABLE_ROUTE)
 from ..exceptions import CrossComputeDataError
-from ..macros.iterable import extend_uniquely, find_item
-from ..macros.web import get_html_from_markdown
+from ..macros.disk import get_hash, get_path_fingerprint
+from ..macros.iterable import extend_uniquely, find_item, index_by
+from ..macros.web import is_block_html
 from ..routines.configuration import (
     get_css_uris,
-    get_template_texts,
+    get_template_fingerprint,
+    get_template_parts,
     get_variable_definitions)
+from ..routines.run import (
+    RunRegistry,
+    format_data_text,
+    get_cache_definition,
+    get_run_hash)
 from ..routines.variable import (
     VariableView,
+    get_variable_fingerprint,
     load_variable_data,
     parse_data_by_id)
 
@@ -34,10 +53,14 @@ from ..routines.variable import (
 class AutomationRoutes():
 
     def __init__(
-            self, automation_definitions, automation_queue, timestamp_object):
-        self.automation_definitions = automation_definitions
+            self, automation_definitions, automation_queue, timestamp_object,
+            definitions_queue=None):
         self.automation_queue = automation_queue
         self._timestamp_object = timestamp_object
+        self._definitions_queue = definitions_queue
+        self._run_registry_by_folder = {}
+        self._index_lock = Lock()
+        self.set_automation_definitions(automation_definitions)
 
     def includeme(self, config):
         config.include(self.configure_root)
@@ -45,6 +68,25 @@ class AutomationRoutes():
         config.include(self.configure_automations)
         config.include(self.configure_batches)
         config.include(self.configure_runs)
+        if self._definitions_queue is not None:
+            receiver_thread = Thread(
+                target=self.receive_definitions, daemon=True)
+            receiver_thread.start()
+
+    def set_automation_definitions(self, automation_definitions):
+        'Swap in new definitions while requests continue to be served'
+        automation_definition_by_slug = index_by(
+            automation_definitions, 'slug', normalize=str.casefold)
+        with self._index_lock:
+            self.automation_definitions = automation_definitions
+            self._automation_definition_by_slug = \
+                automation_definition_by_slug
+
+    def receive_definitions(self):
+        'Apply definitions that the watcher reloaded after a file change'
+        while True:
+            self.set_automation_definitions(self._definitions_queue.get())
+            L.info('configuration reloaded')
 
     def configure_root(self, config):
         config.add_route('root', '/')
@@ -74,11 +116,25 @@ class AutomationRoutes():
         config.add_route(
             'automation',
             AUTOMATION_ROUTE)
+        config.add_route(
+            'automation batches.json',
+            AUTOMATION_ROUTE + '/batches.json')
+        config.add_route(
+            'automation runs.json',
+            AUTOMATION_ROUTE + '/runs.json')
 
         config.add_view(
             self.run_automation,
             route_name='automation.json',
             renderer='json')
+        config.add_view(
+            self.see_automation_batches,
+            route_name='automation batches.json',
+            renderer='json')
+        config.add_view(
+            self.see_automation_runs,
+            route_name='automation runs.json',
+            renderer='json')
         config.add_view(
             self.see_automation,
             route_name='automation',
@@ -97,13 +153,15 @@ class AutomationRoutes():
 
         config.add_view(
             self.see_automation_batch_mode,
-            route_name='automation batch mode',
-            renderer='crosscompute:templates/mode.jinja2')
+            route_name='automation batch mode')
         config.add_view(
             self.see_automation_batch_mode_variable,
             route_name='automation batch mode variable')
 
     def configure_runs(self, config):
+        config.add_route(
+            'automation run.json',
+            AUTOMATION_ROUTE + RUN_ROUTE + '.json')
         config.add_route(
             'automation run',
             AUTOMATION_ROUTE + RUN_ROUTE)
@@ -114,10 +172,13 @@ class AutomationRoutes():
             'automation run mode variable',
             AUTOMATION_ROUTE + RUN_ROUTE + MODE_ROUTE + VARIABLE_ROUTE)
 
+        config.add_view(
+            self.see_automation_run_status,
+            route_name='automation run.json',
+            renderer='json')
         config.add_view(
             self.see_automation_batch_mode,
-            route_name='automation run mode',
-            renderer='crosscompute:templates/mode.jinja2')
+            route_name='automation run mode')
         config.add_view(
             self.see_automation_batch_mode_variable,
             route_name='automation run mode variable')
@@ -175,33 +236,93 @@ class AutomationRoutes():
             data_by_id = parse_data_by_id(data_by_id, variable_definitions)
         except CrossComputeDataError as e:
             raise HTTPBadRequest(e)
-        runs_folder = join(automation_definition['folder'], 'runs')
-        folder = make_random_folder(runs_folder, ID_LENGTH)
+        automation_slug = automation_definition['slug']
+        run_registry = self.get_run_registry(automation_definition)
+        runs_folder = run_registry.runs_folder
+        input_hash = get_hash([format_data_text(data_by_id)])
+        if get_cache_definition(automation_definition) is None:
+            folder = make_random_folder(runs_folder, ID_LENGTH)
+            run_id = basename(folder)
+            run_registry.add(automation_slug, run_id, input_hash)
+        else:
+            run_id = get_run_hash(automation_definition, data_by_id)[
+                :ID_LENGTH]
+            folder = join(runs_folder, run_id)
+            makedirs(folder, exist_ok=True)
+            # Let the registry decide so that one request claims each run
+            if run_registry.add(automation_slug, run_id, input_hash):
+                L.debug('%s run added', format_path(folder))
+            elif run_registry.requeue(run_id):
+                L.debug('%s run requeued', format_path(folder))
+            else:
+                L.debug('%s run cached', format_path(folder))
+                utime(folder)
+                run_registry.touch(run_id)
+                return {'id': run_id}
         self.automation_queue.put((automation_definition, {
             'folder': folder,
             'data_by_id': data_by_id,
         }))
-        run_id = basename(folder)
-        if 'runs' not in automation_definition:
-            automation_definition['runs'] = []
-        run_uri = RUN_ROUTE.format(run_slug=run_id)
-        automation_definition['runs'].append({
-            'name': run_id,
-            'slug': run_id,
-            'folder': folder,
-            'uri': run_uri,
-        })
         # TODO: Change target page depending on definition
         return {'id': run_id}
 
+    def get_run_registry(self, automation_definition):
+        runs_folder = join(automation_definition['folder'], 'runs')
+        with self._index_lock:
+            try:
+                run_registry = self._run_registry_by_folder[runs_folder]
+            except KeyError:
+                run_registry = RunRegistry(runs_folder)
+                self._run_registry_by_folder[runs_folder] = run_registry
+        return run_registry
+
     def see_automation(self, request):
         automation_definition = self.get_automation_definition_from(request)
         css_uris = get_css_uris(automation_definition)
         return automation_definition | {
             'css_uris': css_uris,
+            'batch_listing': self.get_batch_listing(
+                request, automation_definition, 'batch_'),
+            'run_listing': self.get_run_listing(
+                request, automation_definition, 'run_'),
             'timestamp_value': self._timestamp_object.value,
         }
 
+    def see_automation_batches(self, request):
+        automation_definition = self.get_automation_definition_from(request)
+        batch_listing = self.get_batch_listing(request, automation_definition)
+        automation_uri = automation_definition['uri']
+        return batch_listing | {'items': [{
+            'name': _['name'],
+            'slug': _['slug'],
+            'uri': automation_uri + _['uri'],
+        } for _ in batch_listing['items']]}
+
+    def see_automation_runs(self, request):
+        automation_definition = self.get_automation_definition_from(request)
+        run_listing = self.get_run_listing(request, automation_definition)
+        automation_uri = automation_definition['uri']
+        request.response.cache_control = 'no-cache'
+        return run_listing | {'items': [{
+            'name': _['name'],
+            'slug': _['slug'],
+            'uri': automation_uri + _['uri'],
+            'status': _['status'],
+            'return_code': _['return_code'],
+            'duration_in_seconds': _['duration_in_seconds'],
+            'creation_time': _['creation_time'],
+            'update_time': _['update_time'],
+        } for _ in run_listing['items']]}
+
+    def see_automation_run_status(self, request):
+        automation_definition = self.get_automation_definition_from(request)
+        run_definition = self.get_batch_definition_from(
+            request, automation_definition)
+        request.response.cache_control = 'no-cache'
+        return {k: run_definition[k] for k in [
+            'id', 'status', 'return_code', 'duration_in_seconds',
+            'creation_time', 'update_time']}
+
     def see_automation_batch_mode(self, request):
         automation_definition = self.get_automation_definition_from(request)
         automation_folder = automation_definition['folder']
@@ -211,19 +332,36 @@ class AutomationRoutes():
             'folder'])
         mode_name = self.get_mode_name_from(request)
         css_uris = get_css_uris(automation_definition)
-        template_text = '\n'.join(get_template_texts(
-            automation_definition, mode_name))
         variable_definitions = get_variable_definitions(
             automation_definition, mode_name, with_all=True)
-        return {
-            'automation_definition': automation_definition,
-            # 'batch_definition': batch_definition,
-            # 'uri': request.path,
-            'mode_name': mode_name,
-            'timestamp_value': self._timestamp_object.value,
-        } | render_mode_dictionary(
-            request, mode_name, css_uris, template_text, variable_definitions,
-            absolute_batch_folder)
+        timestamp_value = self._timestamp_object.value
+        page_etag = get_hash([
+            request.path, timestamp_value, css_uris,
+            get_template_fingerprint(automation_definition, mode_name),
+            get_variable_fingerprint(
+                variable_definitions, absolute_batch_folder)])
+        if page_etag in request.if_none_match:
+            return HTTPNotModified(etag=page_etag)
+        page_html = PAGE_CACHE.get(page_etag)
+        if page_html is None:
+            template_parts = get_template_parts(
+                automation_definition, mode_name)
+            page_html = render('crosscompute:templates/mode.jinja2', {
+                'automation_definition': automation_definition,
+                # 'batch_definition': batch_definition,
+                # 'uri': request.path,
+                'batch_uri': automation_definition['uri'] + batch_definition[
+                    'uri'],
+                'mode_name': mode_name,
+                'timestamp_value': timestamp_value,
+            } | render_mode_dictionary(
+                request, mode_name, css_uris, template_parts,
+                variable_definitions, absolute_batch_folder), request)
+            PAGE_CACHE.set(page_etag, page_html)
+        response = Response(page_html, conditional_response=True)
+        response.etag = page_etag
+        response.cache_control = 'no-cache'
+        return response
 
     def see_automation_batch_mode_variable(self, request):
         automation_definition = self.get_automation_definition_from(request)
@@ -250,35 +388,65 @@ class AutomationRoutes():
             raise HTTPNotFound
         L.debug(variable_definition)
         if splitext(path)[1] == '.dictionary':
-            return Response(load_variable_data(path, variable_id))
-        return FileResponse(path, request=request)
+            response = get_dictionary_value_response(path, variable_id)
+        else:
+            response = FileResponse(path, request=request)
+        response.etag = get_hash([get_path_fingerprint(path), variable_id])
+        response.accept_ranges = 'bytes'
+        return response
 
     def get_automation_definition_from(self, request):
         matchdict = request.matchdict
         automation_slug = matchdict['automation_slug']
         try:
-            automation_definition = find_item(
-                self.automation_definitions, 'slug', automation_slug,
-                normalize=str.casefold)
-        except StopIteration:
+            automation_definition = self._automation_definition_by_slug[
+                automation_slug.casefold()]
+        except KeyError:
             raise HTTPNotFound
         return automation_definition
 
     def get_batch_definition_from(self, request, automation_definition):
         matchdict = request.matchdict
-        if 'batch_slug' in matchdict:
-            slug = matchdict['batch_slug']
-            key = 'batches'
-        else:
-            slug = matchdict['run_slug']
-            key = 'runs'
+        if 'run_slug' in matchdict:
+            batch_definition = self.get_run_registry(
+                automation_definition).get_run_definition(
+                    automation_definition['slug'], matchdict['run_slug'])
+            if batch_definition is None:
+                raise HTTPNotFound
+            return batch_definition
+        batch_definitions = automation_definition['batches']
         try:
-            batch_definition = find_item(automation_definition.get(
-                key, []), 'slug', slug)
-        except StopIteration:
+            batch_definition = batch_definitions.find(matchdict['batch_slug'])
+        except CrossComputeDataError as e:
+            L.error(e)
+            raise HTTPNotFound
+        if batch_definition is None:
             raise HTTPNotFound
         return batch_definition
 
+    def get_batch_listing(self, request, automation_definition, prefix=''):
+        'Get a page of batches filtered and sorted by name'
+        text, sort_key, page, size = get_listing_options(
+            request.params, prefix, BATCH_SORT_KEYS)
+        batch_count, batch_definitions = automation_definition[
+            'batches'].search(text, sort_key, (page - 1) * size, size)
+        return get_listing(
+            request.params, prefix, batch_definitions, batch_count, text,
+            sort_key, BATCH_SORT_KEYS, page, size)
+
+    def get_run_listing(self, request, automation_definition, prefix=''):
+        'Get a page of runs filtered by name and sorted by time or name'
+        text, sort_key, page, size = get_listing_options(
+            request.params, prefix, RUN_SORT_KEYS)
+        automation_slug = automation_definition['slug']
+        run_registry = self.get_run_registry(automation_definition)
+        run_count = run_registry.count_runs(automation_slug, text)
+        run_definitions = run_registry.get_run_definitions(
+            automation_slug, (page - 1) * size, size, text, sort_key)
+        return get_listing(
+            request.params, prefix, run_definitions, run_count, text,
+            sort_key, RUN_SORT_KEYS, page, size)
+
     def get_mode_name_from(self, request):
         matchdict = request.matchdict
         mode_code = matchdict['mode_code']
@@ -289,35 +457,97 @@ class AutomationRoutes():
         return mode_name
 
 
+def get_listing_options(params, prefix, sort_keys):
+    'Read the query, sort, page and size of a listing from request params'
+    text = params.get(prefix + 'query', '').strip()
+    sort_key = params.get(prefix + 'sort', '')
+    if sort_key not in sort_keys:
+        raise HTTPBadRequest(f'{prefix}sort must be one of {sort_keys}')
+    try:
+        page = int(params.get(prefix + 'page', 1))
+        size = int(params.get(prefix + 'size', PAGE_SIZE))
+    except ValueError:
+        raise HTTPBadRequest(f'{prefix}page and {prefix}size must be numbers')
+    if page < 1 or not 1 <= size <= MAXIMUM_PAGE_SIZE:
+        raise HTTPBadRequest(
+            f'{prefix}page must be positive and {prefix}size must be '
+            f'between 1 and {MAXIMUM_PAGE_SIZE}')
+    return text, sort_key, page, size
+
+
+def get_listing(
+        params, prefix, items, item_count, text, sort_key, sort_keys, page,
+        size):
+    'Describe a page of items with query strings for neighboring pages'
+    page_count = max(1, ceil(item_count / size))
+
+    def get_page_query(page):
+        return '?' + urlencode(dict(params) | {prefix + 'page': page})
+
+    return {
+        'items': items,
+        'count': item_count,
+        'query': text,
+        'sort': sort_key,
+        'sort_keys': sort_keys,
+        'page': page,
+        'page_count': page_count,
+        'size': size,
+        'previous_page_query': get_page_query(page - 1) if page > 1 else '',
+        'next_page_query': get_page_query(
+            page + 1) if page < page_count else '',
+    }
+
+
+def get_dictionary_value_response(path, variable_id):
+    'Serve one value from a dictionary file, supporting range requests'
+    variable_data = load_variable_data(path, variable_id)
+    if isinstance(variable_data, str):
+        body, content_type = variable_data.encode('utf-8'), 'text/plain'
+    else:
+        body, content_type = json.dumps(
+            variable_data).encode('utf-8'), 'application/json'
+    response = Response(
+        body, content_type=content_type, charset='utf-8',
+        conditional_response=True)
+    response.last_modified = getmtime(path)
+    return response
+
+
 def render_mode_dictionary(
-        request, mode_name, css_uris, template_text, variable_definitions,
+        request, mode_name, css_uris, template_parts, variable_definitions,
         absolute_batch_folder):
     css_uris, js_uris, js_texts, variable_index = css_uris.copy(), [], [], 0
-
-    def render_html(match):
-        matching_text = match.group(0)
-        terms = match.group(1).split('|')
-        variable_id = terms[0].strip()
+    body_texts = []
+    variable_definition_by_id = index_by(variable_definitions, 'id')
+    for template_part in template_parts:
+        if isinstance(template_part, str):
+            body_texts.append(template_part)
+            continue
+        variable_id = template_part['id']
         try:
-            d = find_item(variable_definitions, 'id', variable_id)
-        except StopIteration:
+            d = variable_definition_by_id[variable_id]
+        except KeyError:
             L.warning('%s in template but not in configuration', variable_id)
-            return matching_text
-        variable_view = VariableView.get_from(d).load(absolute_batch_folder)
-        nonlocal variable_index
-        variable_element = variable_view.render(
-            mode_name, f'v{variable_index}', terms[1:], request.path)
-        variable_index += 1
-        extend_uniquely(css_uris, variable_element['css_uris'])
-        extend_uniquely(js_uris, variable_element['js_uris'])
-        extend_uniquely(js_texts, variable_element['js_texts'])
-        return variable_element['body_text']
-
+            body_text = template_part['text']
+        else:
+            variable_view = VariableView.get_from(d).load(
+                absolute_batch_folder)
+            variable_element = variable_view.render(
+                mode_name, f'v{variable_index}',
+                template_part['function_names'], request.path)
+            variable_index += 1
+            extend_uniquely(css_uris, variable_element['css_uris'])
+            extend_uniquely(js_uris, variable_element['js_uris'])
+            extend_uniquely(js_texts, variable_element['js_texts'])
+            body_text = variable_element['body_text']
+        if template_part['is_paragraph'] and not is_block_html(body_text):
+            body_text = f'<p>{body_text}</p>'
+        body_texts.append(body_text)
     return {
         'css_uris': css_uris,
         'js_uris': js_uris,
-        'body_text': get_html_from_markdown(VARIABLE_ID_PATTERN.sub(
-            render_html, template_text)),
+        'body_text': ''.join(body_texts),
         'js_text': '\n'.join(js_texts),
     }
 
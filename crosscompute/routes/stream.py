@@ -1,17 +1,29 @@
 # TODO: Include request.path in stream view url
-# TODO: Trigger reload intelligently only if relevant
+import asyncio
+import json
+from functools import partial
 from pyramid.response import Response
-from time import sleep
+from queue import Empty, SimpleQueue
+from threading import Lock, Thread
 
 from ..constants import (
     STREAM_PING_INTERVAL_IN_SECONDS,
+    STREAM_RETRY_IN_MILLISECONDS,
     STREAMS_ROUTE)
+from ..macros.asgi import LoopQueue, wait_for_disconnect
 
 
 class StreamRoutes():
 
-    def __init__(self, timestamp_object):
+    def __init__(
+            self, timestamp_object, message_queue=None,
+            maximum_stream_count=None):
         self._timestamp_object = timestamp_object
+        self._message_queue = message_queue
+        self._maximum_stream_count = maximum_stream_count
+        self._subscriber_queues = set()
+        self._thread_subscriber_queues = set()
+        self._subscriber_lock = Lock()
 
     def includeme(self, config):
         config.add_route('streams', STREAMS_ROUTE)
@@ -27,24 +39,129 @@ class StreamRoutes():
             })
 
         config.action(None, update_renderer_globals)
+        if self._message_queue is not None:
+            publisher_thread = Thread(target=self.publish, daemon=True)
+            publisher_thread.start()
 
     def see_streams(self, request):
-        # TODO: Add url to queue
+        'Stream messages, holding a server thread while the stream is open'
+        subscriber_queue = SimpleQueue()
+        with self._subscriber_lock:
+            thread_subscriber_queues = self._thread_subscriber_queues
+            maximum_stream_count = self._maximum_stream_count
+            if maximum_stream_count is not None and len(
+                    thread_subscriber_queues) >= maximum_stream_count:
+                subscriber_queue = None
+            else:
+                thread_subscriber_queues.add(subscriber_queue)
+        if subscriber_queue is None:
+            # Ask the browser to come back later instead of taking a thread
+            return Response(
+                f'retry: {STREAM_RETRY_IN_MILLISECONDS}\n\n'.encode(),
+                status=503, headerlist=[
+                    ('Content-Type', 'text/event-stream'),
+                    ('Cache-Control', 'no-cache'),
+                    ('Retry-After', str(
+                        STREAM_RETRY_IN_MILLISECONDS // 1000))])
+        self.subscribe(subscriber_queue)
         response = Response(headerlist=[
             ('Content-Type', 'text/event-stream'),
             ('Cache-Control', 'no-cache'),
         ])
-        response.app_iter = self.yield_message()
+        # Release the stream even if the server closes it before iterating
+        response.app_iter = StreamIterator(self.yield_message(
+            subscriber_queue), partial(self.unsubscribe, subscriber_queue))
         return response
 
-    def yield_message(self):
-        # TODO: Send queued changes
-        while True:
-            sleep(STREAM_PING_INTERVAL_IN_SECONDS)
+    def yield_message(self, subscriber_queue):
+        try:
             yield self.make_ping()
+            while True:
+                try:
+                    data = subscriber_queue.get(
+                        timeout=STREAM_PING_INTERVAL_IN_SECONDS)
+                except Empty:
+                    yield self.make_ping()
+                else:
+                    yield self.make_message(data)
+        finally:
+            self.unsubscribe(subscriber_queue)
+
+    async def see_streams_asynchronously(self, scope, receive, send):
+        'Stream messages from the event loop without holding a thread'
+        subscriber_queue = self.subscribe(LoopQueue(
+            asyncio.get_running_loop()))
+        disconnect_task = asyncio.ensure_future(wait_for_disconnect(receive))
+        try:
+            await send({
+                'type': 'http.response.start',
+                'status': 200,
+                'headers': [
+                    (b'content-type', b'text/event-stream'),
+                    (b'cache-control', b'no-cache')]})
+            body = self.make_ping()
+            while not disconnect_task.done():
+                await send({
+                    'type': 'http.response.body',
+                    'body': body,
+                    'more_body': True})
+                get_task = asyncio.ensure_future(subscriber_queue.get())
+                await asyncio.wait(
+                    [get_task, disconnect_task],
+                    timeout=STREAM_PING_INTERVAL_IN_SECONDS,
+                    return_when=asyncio.FIRST_COMPLETED)
+                if get_task.done():
+                    body = self.make_message(get_task.result())
+                else:
+                    get_task.cancel()
+                    body = self.make_ping()
+        except OSError:
+            pass
+        finally:
+            disconnect_task.cancel()
+            self.unsubscribe(subscriber_queue)
+
+    def subscribe(self, subscriber_queue=None):
+        if subscriber_queue is None:
+            subscriber_queue = SimpleQueue()
+        with self._subscriber_lock:
+            self._subscriber_queues.add(subscriber_queue)
+        return subscriber_queue
+
+    def unsubscribe(self, subscriber_queue):
+        with self._subscriber_lock:
+            self._subscriber_queues.discard(subscriber_queue)
+            self._thread_subscriber_queues.discard(subscriber_queue)
+
+    def publish(self):
+        'Relay messages from the watcher and workers to every subscriber'
+        while True:
+            data = self._message_queue.get()
+            with self._subscriber_lock:
+                subscriber_queues = list(self._subscriber_queues)
+            for subscriber_queue in subscriber_queues:
+                subscriber_queue.put(data)
 
     def make_ping(self):
-        return self.make_message(self._timestamp_object.value)
+        return self.make_message({'t': self._timestamp_object.value})
 
     def make_message(self, data):
-        return f'data: {data}\n\n'.encode()
+        text = f'data: {json.dumps(data)}\n\n'
+        if 'event' in data:
+            text = f'event: {data["event"]}\n' + text
+        return text.encode()
+
+
+class StreamIterator():
+    'Iterate messages and run a callback when the server closes the stream'
+
+    def __init__(self, iterator, close):
+        self._iterator = iterator
+        self._close = close
+
+    def __iter__(self):
+        return self._iterator
+
+    def close(self):
+        self._iterator.close()
+        self._close()
@@ -1,18 +1,17 @@
 # TODO: Watch multiple folders if not all under parent folder
 # TODO: Consider whether to send partial updates for variables
-# TODO: Precompile notebook scripts
 import logging
 import subprocess
-from invisibleroads_macros_disk import is_path_in_folder, make_folder
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from invisibleroads_macros_disk import make_folder
 from invisibleroads_macros_log import format_path
+from itertools import islice
 from logging import getLogger
 from multiprocessing import Process, Queue, Value
 from os import environ, getenv, listdir
-from os.path import exists, isdir, join, realpath
-from pyramid.config import Configurator
+from os.path import basename, dirname, exists, isdir, join, realpath
 from time import time
-from waitress import serve
-from watchgod import watch
 
 from ..constants import (
     AUTOMATION_PATH,
@@ -20,24 +19,42 @@ from ..constants import (
     DISK_POLL_IN_MILLISECONDS,
     HOST,
     MODE_NAMES,
+    MODE_ROUTE,
     PORT,
-    STREAMS_ROUTE)
+    RUN_ROUTE,
+    SERVER_BACKEND,
+    SERVER_STREAM_COUNT,
+    SERVER_THREAD_COUNT,
+    STREAMS_ROUTE,
+    VARIABLE_ROUTE)
 from ..exceptions import (
     CrossComputeConfigurationError,
     CrossComputeError)
 from ..macros.iterable import group_by
-from ..macros.process import StoppableProcess
-from ..routes.automation import AutomationRoutes
-from ..routes.stream import StreamRoutes
+from ..macros.process import StoppableProcess, run_process
+from ..macros.watch import get_watcher
 from .configuration import (
-    get_automation_definitions,
+    get_automation_configurations,
+    get_automation_definition,
     get_display_configuration,
     get_variable_definitions,
     load_configuration)
+from .run import (
+    RunRegistry,
+    clean_runs,
+    compile_notebook,
+    get_batch_fingerprint,
+    get_command_string,
+    get_script_limits,
+    get_script_path,
+    load_fingerprint,
+    remove_fingerprint,
+    save_fingerprint)
 from .variable import (
     format_text,
     get_variable_data_by_id,
     save_variable_data)
+from .worker import get_function_worker
 
 
 class Automation():
@@ -45,13 +62,18 @@ class Automation():
     @classmethod
     def load(Class, path_or_folder=None):
         instance = Class()
+        instance._timestamp_object = Value('d', time())
+        instance._is_watching_batches = False
         if isdir(path_or_folder):
             instance.initialize_from_folder(path_or_folder)
         else:
             instance.initialize_from_path(path_or_folder)
         return instance
 
-    def reload(self):
+    def reload(self, changed_paths=None):
+        'Reload configurations, parsing only those affected if possible'
+        if changed_paths and self._reload_paths(changed_paths):
+            return
         path = self.path
         if exists(path):
             self.initialize_from_path(path)
@@ -81,9 +103,13 @@ class Automation():
         configuration = load_configuration(path)
         self.path = path
         self.folder = configuration['folder']
-        self.definitions = get_automation_definitions(configuration)
-        self._file_type_by_path = self._get_file_type_by_path()
-        self._timestamp_object = Value('d', time())
+        automation_configurations = get_automation_configurations(
+            configuration)
+        self._automation_configurations = automation_configurations
+        self._automation_packs = [self._get_automation_pack(
+            _, automation_index) for automation_index, _ in enumerate(
+                automation_configurations)]
+        self._index_automation_packs()
         L.debug('configuration_path = %s', path)
 
     def serve(
@@ -95,25 +121,41 @@ class Automation():
             disk_poll_in_milliseconds=DISK_POLL_IN_MILLISECONDS,
             disk_debounce_in_milliseconds=DISK_DEBOUNCE_IN_MILLISECONDS,
             base_uri='',
-            automation_queue=None):
+            automation_queue=None,
+            worker_count=1,
+            backend=SERVER_BACKEND,
+            is_watching_batches=False):
         if automation_queue is None:
             automation_queue = Queue()
+        message_queue = None if is_static else Queue()
+        definitions_queue = None if is_static and is_production else Queue()
         if getLogger().level > logging.DEBUG:
             getLogger('waitress').setLevel(logging.ERROR)
-            getLogger('watchgod.watcher').setLevel(logging.ERROR)
+            getLogger('uvicorn.error').setLevel(logging.ERROR)
 
         def run_server():
-            L.info('starting worker')
-            worker_process = Process(target=self.work, args=(
-                automation_queue,))
-            worker_process.daemon = True
-            worker_process.start()
+            from waitress import serve
+            from ..macros.asgi import serve_asynchronously
+            L.info('starting %s worker(s)', worker_count)
+            for _ in range(max(1, worker_count)):
+                worker_process = Process(target=self.work, args=(
+                    automation_queue, message_queue))
+                worker_process.daemon = True
+                worker_process.start()
             L.info('serving at http://%s:%s%s', host, port, base_uri)
             # TODO: Decouple from pyramid and waitress
             app = self._get_app(
-                automation_queue, is_static, is_production, base_uri)
+                automation_queue, message_queue, is_static, is_production,
+                base_uri, backend, definitions_queue)
             try:
-                serve(app, host=host, port=port, url_prefix=base_uri)
+                if backend == 'uvicorn':
+                    serve_asynchronously(app, host, port)
+                else:
+                    serve(
+                        app, host=host, port=port, url_prefix=base_uri,
+                        threads=SERVER_THREAD_COUNT)
+            except ImportError:
+                L.error('pip install uvicorn')
             except OSError as e:
                 L.error(e)
 
@@ -123,54 +165,148 @@ class Automation():
 
         self.watch(
             run_server, disk_poll_in_milliseconds,
-            disk_debounce_in_milliseconds)
+            disk_debounce_in_milliseconds, message_queue, is_watching_batches,
+            definitions_queue)
 
-    def run(self):
+    def run(self, worker_count=None, is_incremental=False):
+        batch_count, start_time = 0, time()
         for automation_definition in self.definitions:
-            for batch_definition in automation_definition.get('batches', []):
-                run_automation(automation_definition, batch_definition)
+            batch_count += run_batches(
+                automation_definition, worker_count, is_incremental)
+        duration_in_seconds = time() - start_time
+        L.info(
+            '%s batches ran in %.1f seconds (%.2f batches per second)',
+            batch_count, duration_in_seconds,
+            batch_count / duration_in_seconds if duration_in_seconds else 0)
 
-    def work(self, automation_queue):
+    def work(self, automation_queue, message_queue=None):
+        run_registry_by_folder = {}
         try:
             while automation_pack := automation_queue.get():
-                run_automation(*automation_pack)
+                automation_definition, batch_definition = automation_pack
+                run_folder = batch_definition['folder']
+                runs_folder = dirname(run_folder)
+                try:
+                    run_registry = run_registry_by_folder[runs_folder]
+                except KeyError:
+                    run_registry = RunRegistry(runs_folder)
+                    run_registry_by_folder[runs_folder] = run_registry
+                run_id = basename(run_folder)
+                run_uri = automation_definition['uri'] + RUN_ROUTE.format(
+                    run_slug=run_id)
+                self._update_run(
+                    message_queue, run_registry, run_id, run_uri, 'running')
+                start_time = time()
+                try:
+                    run_status, return_code = run_automation(
+                        automation_definition, batch_definition)
+                except Exception:
+                    # Keep the worker for the next run in the queue
+                    L.exception('%s failed', run_uri)
+                    run_status, return_code = 'failed', None
+                self._update_run(
+                    message_queue, run_registry, run_id, run_uri, run_status,
+                    return_code, time() - start_time)
+                self._announce(message_queue, [run_uri])
+                clean_runs(automation_definition, [run_folder])
         except KeyboardInterrupt:
             pass
 
     def watch(
             self, run_server, disk_poll_in_milliseconds,
-            disk_debounce_in_milliseconds):
+            disk_debounce_in_milliseconds, message_queue=None,
+            is_watching_batches=False, definitions_queue=None):
+        'Run the server and send it definitions that change with the files'
         server_process = StoppableProcess(target=run_server)
         server_process.start()
-        for changes in watch(
-                self.folder, min_sleep=disk_poll_in_milliseconds,
-                debounce=disk_debounce_in_milliseconds):
-            for changed_type, changed_path in changes:
+        if is_watching_batches:
+            self._is_watching_batches = True
+            self._index_automation_packs()
+        watcher = get_watcher(
+            self._get_watched_paths(),
+            disk_poll_in_milliseconds, disk_debounce_in_milliseconds)
+        for changed_paths in watcher:
+            is_changed, changed_uris = False, set()
+            changed_configuration_paths = set()
+            is_definitions_changed = False
+            for changed_path in changed_paths:
                 try:
-                    file_type = self._get_file_type(changed_path)
+                    file_type = self._file_type_by_path[changed_path]
                 except KeyError:
                     continue
-                L.debug('%s %s %s', changed_type, changed_path, file_type)
+                L.debug('%s %s', changed_path, file_type)
                 if file_type == 'c':
+                    changed_configuration_paths.add(changed_path)
+                elif file_type == 'n':
                     try:
-                        self.reload()
-                    except CrossComputeError as e:
+                        compile_notebook(changed_path)
+                    except CrossComputeConfigurationError as e:
                         L.error(e)
-                        continue
-                    server_process.stop()
-                    server_process = StoppableProcess(target=run_server)
-                    server_process.start()
                 elif file_type == 's':
                     for d in self.definitions:
                         d['display'] = get_display_configuration(d)
-                    self._timestamp_object.value = time()
+                    is_definitions_changed = is_changed = True
+                elif uris := self._uris_by_path.get(changed_path):
+                    changed_uris.update(uris)
+                else:
+                    is_changed = True
+            if changed_configuration_paths:
+                try:
+                    self.reload(changed_configuration_paths)
+                except CrossComputeError as e:
+                    L.error(e)
                 else:
-                    self._timestamp_object.value = time()
+                    watcher.set_paths(self._get_watched_paths())
+                    is_definitions_changed = is_changed = True
+            if is_definitions_changed and definitions_queue is not None:
+                definitions_queue.put(self.definitions)
+            if is_changed:
+                self._announce(message_queue)
+            elif changed_uris:
+                self._announce(message_queue, sorted(changed_uris))
+
+    def _announce(self, message_queue, changed_uris=None):
+        'Tell pages about changes; omit changed_uris to reload every page'
+        if changed_uris:
+            # Leave the timestamp so that pages and their etags stay valid
+            message_dictionary = {'uris': changed_uris}
+        else:
+            timestamp = time()
+            self._timestamp_object.value = timestamp
+            message_dictionary = {'t': timestamp}
+        if message_queue is None:
+            return
+        message_queue.put(message_dictionary)
+
+    def _update_run(
+            self, message_queue, run_registry, run_id, run_uri, status,
+            return_code=None, duration_in_seconds=None):
+        'Record the status of a run and tell subscribers with a run event'
+        run_registry.set_status(
+            run_id, status, return_code, duration_in_seconds)
+        if message_queue is None:
+            return
+        message_queue.put({
+            'event': 'run',
+            'uri': run_uri,
+            'status': status,
+            'return_code': return_code,
+            'duration_in_seconds': duration_in_seconds})
 
-    def _get_app(self, automation_queue, is_static, is_production, base_uri):
+    def _get_app(
+            self, automation_queue, message_queue, is_static, is_production,
+            base_uri, backend=SERVER_BACKEND, definitions_queue=None):
+        from pyramid.config import Configurator
+        from ..macros.asgi import AsynchronousApplication
+        from ..routes.automation import AutomationRoutes
+        from ..routes.stream import StreamRoutes
         automation_routes = AutomationRoutes(
-            self.definitions, automation_queue, self._timestamp_object)
-        stream_routes = StreamRoutes(self._timestamp_object)
+            self.definitions, automation_queue, self._timestamp_object,
+            definitions_queue)
+        # Streams hold a thread each unless the event loop serves them
+        stream_routes = StreamRoutes(
+            self._timestamp_object, message_queue,
+            None if backend == 'uvicorn' else SERVER_STREAM_COUNT)
         with Configurator() as config:
             config.include('pyramid_jinja2')
             config.include(automation_routes.includeme)
@@ -189,97 +325,320 @@ class Automation():
                 })
 
             config.action(None, update_renderer_globals)
-        return config.make_wsgi_app()
+        app = config.make_wsgi_app()
+        if backend == 'uvicorn':
+            app = AsynchronousApplication(app, base_uri, {} if is_static else {
+                STREAMS_ROUTE: stream_routes.see_streams_asynchronously,
+            }, SERVER_THREAD_COUNT)
+        return app
 
-    def _get_file_type(self, path):
-        for automation_definition in self.definitions:
-            automation_folder = automation_definition['folder']
-            if is_path_in_folder(path, join(automation_folder, 'runs')):
-                return 'v'
-        return self._file_type_by_path[realpath(path)]
+    def _get_watched_paths(self):
+        return list(self._file_type_by_path)
 
-    def _get_file_type_by_path(self):
-        'Set c = configuration, s = style, t = template, v = variable'
-        file_type_by_path = {}
+    def _reload_paths(self, changed_paths):
+        '''
+        Re-parse only the configurations that depend on the changed paths
+        and return False if the import graph might have changed
+        '''
+        automation_indices = set()
+        for changed_path in changed_paths:
+            if not exists(changed_path):
+                return False
+            try:
+                automation_indices.update(
+                    self._automation_indices_by_path[changed_path])
+            except KeyError:
+                return False
+        automation_configurations = list(self._automation_configurations)
+        configuration_by_id = {}
+        for automation_index in sorted(automation_indices):
+            old_configuration = automation_configurations[automation_index]
+            configuration = load_configuration(old_configuration['path'])
+            if configuration.get('imports') != old_configuration.get(
+                    'imports'):
+                return False
+            if 'parent' in old_configuration:
+                configuration['parent'] = old_configuration['parent']
+            configuration_by_id[id(old_configuration)] = configuration
+            automation_configurations[automation_index] = configuration
+        for configuration in automation_configurations:
+            # Point imported configurations to their reloaded parents
+            if 'parent' not in configuration:
+                continue
+            parent = configuration['parent']
+            configuration['parent'] = configuration_by_id.get(
+                id(parent), parent)
+        automation_packs = list(self._automation_packs)
+        for automation_index in automation_indices:
+            automation_packs[automation_index] = self._get_automation_pack(
+                automation_configurations[automation_index], automation_index)
+        self._automation_configurations = automation_configurations
+        self._automation_packs = automation_packs
+        self._index_automation_packs()
+        L.debug(
+            'reloaded %s of %s configurations', len(automation_indices),
+            len(automation_configurations))
+        return True
 
-        def add(path, file_type):
-            file_type_by_path[realpath(path)] = file_type
+    def _index_automation_packs(self):
+        self.definitions = [
+            _[0] for _ in self._automation_packs if _[0] is not None]
+        file_type_by_path, uris_by_path = {}, defaultdict(list)
+        automation_indices_by_path = defaultdict(set)
+        for automation_index, (
+            automation_definition, automation_file_type_by_path,
+            automation_uris_by_path,
+        ) in enumerate(self._automation_packs):
+            file_type_by_path.update(automation_file_type_by_path)
+            for path, uris in automation_uris_by_path.items():
+                uris_by_path[path].extend(uris)
+            for path, file_type in automation_file_type_by_path.items():
+                if file_type == 'c':
+                    automation_indices_by_path[path].add(automation_index)
+            if automation_definition is None or not (
+                    self._is_watching_batches):
+                continue
+            # Index batch variables only if requested because a batch
+            # configuration can have many rows
+            automation_uri = automation_definition['uri']
+            for batch_definition in automation_definition['batches']:
+                batch_folder = join(
+                    automation_definition['folder'], batch_definition[
+                        'folder'])
+                batch_uri = automation_uri + batch_definition['uri']
+                for path, uri in self._yield_variable_pack_from_folder(
+                        automation_definition, batch_folder, batch_uri):
+                    path = realpath(path)
+                    file_type_by_path[path] = 'v'
+                    uris_by_path[path].append(uri)
+        self._file_type_by_path = file_type_by_path
+        self._uris_by_path = dict(uris_by_path)
+        self._automation_indices_by_path = dict(automation_indices_by_path)
 
-        for path in [self.path] + [_['path'] for _ in self.definitions]:
-            add(path, 'c')
-        for automation_definition in self.definitions:
-            folder = automation_definition['folder']
-            configuration = load_configuration(automation_definition['path'])
-            for batch_definition in configuration.get('batches', []):
-                batch_configuration = batch_definition.get('configuration', {})
-                if 'path' not in batch_configuration:
-                    continue
-                add(join(folder, batch_configuration['path']), 'c')
-            for mode_name in MODE_NAMES:
-                mode_configuration = automation_definition.get(mode_name, {})
-                template_definitions = mode_configuration.get('templates', [])
-                for template_definition in template_definitions:
-                    if 'path' not in template_definition:
-                        continue
-                    add(join(folder, template_definition['path']), 't')
-            for batch_definition in automation_definition.get('batches', []):
-                for path in self._get_paths_from_folder(join(
-                        folder, batch_definition['folder'])):
-                    add(path, 'v')
-            display_configuration = automation_definition.get('display', {})
-            for style_definition in display_configuration.get('styles', []):
-                if 'path' not in style_definition:
+    def _get_automation_pack(self, automation_configuration, automation_index):
+        '''
+        Get the definition of one configuration and the files that it uses,
+        where c = configuration, n = notebook, s = style, t = template,
+        v = variable
+        '''
+        file_type_by_path, uris_by_path = {}, defaultdict(list)
+
+        def add(path, file_type, uri=None):
+            path = realpath(path)
+            file_type_by_path[path] = file_type
+            if uri:
+                uris_by_path[path].append(uri)
+
+        folder = automation_configuration['folder']
+        add(automation_configuration['path'], 'c')
+        # Read batch configuration paths before batches become definitions
+        for batch_definition in automation_configuration.get('batches', []):
+            batch_configuration = batch_definition.get('configuration', {})
+            if 'path' not in batch_configuration:
+                continue
+            add(join(folder, batch_configuration['path']), 'c')
+        automation_definition = get_automation_definition(
+            automation_configuration, automation_index)
+        if automation_definition is None:
+            return None, file_type_by_path, {}
+        automation_uri = automation_definition['uri']
+        try:
+            # Compile notebooks before the first run
+            get_command_string(automation_definition)
+        except CrossComputeConfigurationError as e:
+            L.error(e)
+        script_path = get_script_path(automation_definition)
+        if script_path.endswith('.ipynb'):
+            add(script_path, 'n')
+        for mode_name in MODE_NAMES:
+            mode_configuration = automation_definition.get(mode_name, {})
+            template_definitions = mode_configuration.get('templates', [])
+            for template_definition in template_definitions:
+                if 'path' not in template_definition:
                     continue
-                add(join(folder, style_definition['path']), 's')
-        return file_type_by_path
+                add(join(
+                    folder, template_definition['path'],
+                ), 't', automation_uri)
+        display_configuration = automation_definition.get('display', {})
+        for style_definition in display_configuration.get('styles', []):
+            if 'path' not in style_definition:
+                continue
+            add(join(folder, style_definition['path']), 's')
+        return automation_definition, file_type_by_path, dict(uris_by_path)
 
-    def _get_paths_from_folder(self, folder):
-        paths = set()
-        for automation_definition in self.definitions:
-            for mode_name in MODE_NAMES:
-                mode_configuration = automation_definition.get(mode_name, {})
-                variable_definitions = mode_configuration.get('variables', [])
-                for variable_definition in variable_definitions:
-                    variable_configuration = variable_definition.get(
-                        'configuration', {})
-                    if 'path' in variable_configuration:
-                        paths.add(join(folder, variable_configuration['path']))
-                    paths.add(join(folder, variable_definition['path']))
-        return paths
-
-
-def run_automation(automation_definition, batch_definition):
+    def _yield_variable_pack_from_folder(
+            self, automation_definition, folder, batch_uri):
+        for mode_name in MODE_NAMES:
+            mode_folder = join(folder, mode_name)
+            mode_configuration = automation_definition.get(mode_name, {})
+            variable_definitions = mode_configuration.get('variables', [])
+            for variable_definition in variable_definitions:
+                uri = get_variable_uri(
+                    batch_uri, mode_name, variable_definition['id'])
+                variable_configuration = variable_definition.get(
+                    'configuration', {})
+                if 'path' in variable_configuration:
+                    yield join(mode_folder, variable_configuration[
+                        'path']), uri
+                yield join(mode_folder, variable_definition['path']), uri
+
+
+def get_variable_uri(batch_uri, mode_name, variable_id):
+    return batch_uri + MODE_ROUTE.format(
+        mode_code=mode_name[0]) + VARIABLE_ROUTE.format(
+        variable_id=variable_id)
+
+
+def run_batches(
+        automation_definition, worker_count=None, is_incremental=False):
+    'Run each batch and return the number of batches that were not skipped'
+    batch_definitions = automation_definition.get('batches', [])
+    batch_count = len(batch_definitions)
+    if not worker_count:
+        worker_count = get_worker_count(automation_definition)
+    worker_count = min(worker_count, batch_count)
+    if worker_count <= 1:
+        return run_batch_chunk(
+            automation_definition, batch_definitions, is_incremental)
+    L.info(
+        '%s %s running %s batches using %s workers',
+        automation_definition['name'], automation_definition['version'],
+        batch_count, worker_count)
+    # Omit batches so that each chunk sent to a worker stays small
+    automation_definition = {k: v for k, v in automation_definition.items(
+    ) if k != 'batches'}
+    chunk_size = max(1, batch_count // (worker_count * 4))
+    batch_iterator = iter(batch_definitions)
+    ran_count, futures = 0, set()
+    with ProcessPoolExecutor(max_workers=worker_count) as executor:
+        while True:
+            # Submit a bounded window of chunks so that memory stays flat
+            while len(futures) < worker_count * 2 and (chunk := list(islice(
+                    batch_iterator, chunk_size))):
+                futures.add(executor.submit(
+                    run_batch_chunk, automation_definition, chunk,
+                    is_incremental))
+            if not futures:
+                break
+            done_futures, futures = wait(
+                futures, return_when=FIRST_COMPLETED)
+            ran_count += sum(_.result() for _ in done_futures)
+    return ran_count
+
+
+def run_batch_chunk(
+        automation_definition, batch_definitions, is_incremental=False):
+    'Run a chunk of batches and return the number that were not skipped'
+    ran_count = 0
+    for batch_definition in batch_definitions:
+        run_status, return_code = run_automation(
+            automation_definition, batch_definition, is_incremental)
+        if run_status != 'skipped':
+            ran_count += 1
+    return ran_count
+
+
+def get_worker_count(automation_definition):
     script_definition = automation_definition.get('script', {})
-    command_string = script_definition.get('command')
-    if not command_string:
-        return
+    try:
+        worker_count = int(script_definition.get('worker_count', 1))
+    except ValueError:
+        raise CrossComputeConfigurationError(
+            'worker_count must be an integer')
+    return worker_count
+
+
+def run_automation(
+        automation_definition, batch_definition, is_incremental=False):
+    '''
+    Run the script on a batch and return its status and exit code, where
+    status is done, failed, timed out or skipped and the exit code is None
+    if the script did not finish
+    '''
+    script_definition = automation_definition.get('script', {})
+    function_string = script_definition.get('function')
+    try:
+        command_string = get_command_string(automation_definition)
+    except CrossComputeConfigurationError as e:
+        L.error(e)
+        return 'failed', None
+    if not command_string and not function_string:
+        return 'done', 0
     folder = automation_definition['folder']
     batch_folder, custom_environment = prepare_batch(
         automation_definition, batch_definition)
+    absolute_batch_folder = join(folder, batch_folder)
+    fingerprint = get_batch_fingerprint(
+        automation_definition, batch_definition, custom_environment)
+    if is_incremental and fingerprint == load_fingerprint(
+            absolute_batch_folder):
+        L.info(
+            '%s %s skipping %s', automation_definition['name'],
+            automation_definition['version'],
+            format_path(absolute_batch_folder))
+        return 'skipped', 0
+    remove_fingerprint(absolute_batch_folder)
     L.info(
         '%s %s running %s', automation_definition['name'],
         automation_definition['version'],
-        format_path(join(folder, batch_folder)))
+        format_path(absolute_batch_folder))
     mode_folder_by_name = {_ + '_folder': make_folder(join(
         folder, batch_folder, _)) for _ in MODE_NAMES}
     script_environment = {
         'CROSSCOMPUTE_' + k.upper(): v for k, v in mode_folder_by_name.items()
     } | {'PATH': getenv('PATH', '')} | custom_environment
+    script_path = get_script_path(automation_definition)
+    if script_path.endswith('.ipynb'):
+        # Let compiled notebooks import modules next to them like in Jupyter
+        script_environment['PYTHONPATH'] = dirname(script_path)
     L.debug('environment = %s', script_environment)
     debug_folder = mode_folder_by_name['debug_folder']
     o_path = join(debug_folder, 'stdout.txt')
     e_path = join(debug_folder, 'stderr.txt')
     try:
-        with open(o_path, 'wt') as o_file, open(e_path, 'wt') as e_file:
-            subprocess.run(
-                format_text(command_string, mode_folder_by_name), check=True,
-                shell=True,  # Expand $HOME and ~
-                cwd=join(folder, script_definition.get('folder', '.')),
-                env=script_environment, stdout=o_file, stderr=e_file)
+        timeout_in_seconds, limit_by_resource_name = get_script_limits(
+            automation_definition)
+    except CrossComputeConfigurationError as e:
+        L.error(e)
+        return 'failed', None
+    try:
+        if function_string:
+            return_code = get_function_worker(automation_definition, {
+                k: v for k, v in limit_by_resource_name.items()
+                if k != 'RLIMIT_CPU'
+            }).run(
+                mode_folder_by_name, script_environment, o_path, e_path,
+                timeout_in_seconds)
+        else:
+            return_code = run_command(
+                command_string, mode_folder_by_name, script_environment,
+                o_path, e_path, timeout_in_seconds, limit_by_resource_name,
+                join(folder, script_definition.get('folder', '.')))
     except OSError as e:
         L.error(e)
-    except subprocess.CalledProcessError:
+        return 'failed', None
+    except subprocess.TimeoutExpired:
+        L.error(
+            '%s %s timed out after %s seconds', automation_definition['name'],
+            automation_definition['version'], timeout_in_seconds)
+        return 'timed out', None
+    if return_code:
         L.error(open(e_path, 'rt').read().rstrip())
+        return 'failed', return_code
+    save_fingerprint(absolute_batch_folder, fingerprint)
+    return 'done', return_code
+
+
+def run_command(
+        command_string, mode_folder_by_name, script_environment, o_path,
+        e_path, timeout_in_seconds, limit_by_resource_name, script_folder):
+    with open(o_path, 'wt') as o_file, open(e_path, 'wt') as e_file:
+        return run_process(
+            format_text(command_string, mode_folder_by_name),
+            timeout_in_seconds, limit_by_resource_name,
+            shell=True,  # Expand $HOME and ~
+            cwd=script_folder, env=script_environment, stdout=o_file,
+            stderr=e_file)
 
 
 def prepare_batch(automation_definition, batch_definition):
@@ -1,39 +1,52 @@
 # TODO: Save to yaml, ini, toml
+import json
+import pickle
+import re
+import sys
 import tomli
+from array import array
+from collections.abc import Sequence
 from configparser import ConfigParser
+from copy import deepcopy
+from itertools import chain, islice
 from invisibleroads_macros_log import format_path
 from logging import getLogger
+from os import getpid, makedirs, remove, replace
 from os.path import abspath, basename, dirname, exists, join, splitext
 from ruamel.yaml import YAML
 from ruamel.yaml.error import YAMLError
+from threading import Lock
 from time import time
 
 from .. import __version__
 from ..constants import (
     AUTOMATION_NAME,
     AUTOMATION_ROUTE,
+    BATCH_CHUNK_ROW_COUNT,
     BATCH_ROUTE,
+    CONFIGURATION_CACHE,
     MODE_NAMES,
-    STYLE_ROUTE)
+    STYLE_ROUTE,
+    TEMPLATE_CACHE,
+    VARIABLE_ID_PATTERN)
 from ..exceptions import (
     CrossComputeConfigurationError,
+    CrossComputeDataError,
     CrossComputeError)
-from ..macros.web import format_slug
+from ..macros.disk import get_path_fingerprint
+from ..macros.table import load_csv_row, yield_csv_row_packs
+from ..macros.web import format_slug, get_html_from_markdown
 from .variable import (
+    VariableView,
     format_text,
-    yield_data_by_id_from_csv,
+    parse_data_by_id,
+    parse_data_by_id_by_column,
     yield_data_by_id_from_txt)
 
 
 def load_configuration(configuration_path):
     configuration_path = abspath(configuration_path)
-    configuration_format = get_configuration_format(configuration_path)
-    load_raw_configuration = {
-        'ini': load_raw_configuration_ini,
-        'toml': load_raw_configuration_toml,
-        'yaml': load_raw_configuration_yaml,
-    }[configuration_format]
-    configuration = load_raw_configuration(configuration_path)
+    configuration = get_raw_configuration(configuration_path)
     configuration['folder'] = dirname(configuration_path)
     configuration['path'] = configuration_path
     configuration = validate_configuration(configuration)
@@ -41,6 +54,77 @@ def load_configuration(configuration_path):
     return configuration
 
 
+def get_raw_configuration(configuration_path):
+    '''
+    Parse the configuration once per file version and return a copy that
+    the caller can change; keep a pickle in __pycache__ across restarts
+    unless python was asked not to write bytecode
+    '''
+    configuration_format = get_configuration_format(configuration_path)
+    fingerprint = get_path_fingerprint(configuration_path)
+    if fingerprint[-1] is None:
+        raise CrossComputeConfigurationError(
+            f'{configuration_path} not found')
+    try:
+        old_fingerprint, configuration = CONFIGURATION_CACHE[
+            configuration_path]
+    except KeyError:
+        old_fingerprint = None
+    if old_fingerprint != fingerprint:
+        cache_path = join(dirname(configuration_path), '__pycache__', basename(
+            configuration_path) + '.pickle')
+        cache_key = fingerprint[1:] + (__version__,)
+        configuration = load_configuration_pickle(cache_path, cache_key)
+        if configuration is None:
+            load_raw_configuration = {
+                'ini': load_raw_configuration_ini,
+                'toml': load_raw_configuration_toml,
+                'yaml': load_raw_configuration_yaml,
+            }[configuration_format]
+            configuration = load_raw_configuration(configuration_path)
+            if not sys.dont_write_bytecode:
+                save_configuration_pickle(
+                    cache_path, cache_key, configuration)
+        CONFIGURATION_CACHE[configuration_path] = fingerprint, configuration
+    return deepcopy(configuration)
+
+
+def load_configuration_pickle(cache_path, cache_key):
+    '''
+    Unpickle the configuration only if the header line of the file matches
+    the cache key, so that stale or foreign pickles are never loaded
+    '''
+    try:
+        with open(cache_path, 'rb') as cache_file:
+            if cache_file.readline() != get_cache_header(cache_key):
+                return
+            return pickle.load(cache_file)
+    except FileNotFoundError:
+        return
+    except Exception as e:
+        L.debug('could not load %s: %s', format_path(cache_path), e)
+
+
+def save_configuration_pickle(cache_path, cache_key, configuration):
+    temporary_path = f'{cache_path}.{getpid()}'
+    try:
+        makedirs(dirname(cache_path), exist_ok=True)
+        with open(temporary_path, 'wb') as cache_file:
+            cache_file.write(get_cache_header(cache_key))
+            pickle.dump(configuration, cache_file)
+        replace(temporary_path, cache_path)
+    except Exception as e:
+        L.debug('could not save %s: %s', format_path(cache_path), e)
+        try:
+            remove(temporary_path)
+        except OSError:
+            pass
+
+
+def get_cache_header(cache_key):
+    return json.dumps(cache_key).encode() + b'\n'
+
+
 def get_configuration_format(path):
     file_extension = splitext(path)[1]
     try:
@@ -118,27 +202,24 @@ def load_raw_configuration_yaml(configuration_path, with_comments=False):
     return configuration or {}
 
 
-def get_automation_definitions(configuration):
-    automation_definitions = []
-    for automation_index, automation_configuration in enumerate(
-            get_automation_configurations(configuration)):
-        if 'output' not in automation_configuration:
-            continue
-        automation_name = automation_configuration.get(
-            'name', make_automation_name(automation_index))
-        automation_slug = automation_configuration.get(
-            'slug', format_slug(automation_name))
-        automation_uri = AUTOMATION_ROUTE.format(
-            automation_slug=automation_slug)
-        automation_configuration['name'] = automation_name
-        automation_configuration['slug'] = automation_slug
-        automation_configuration['uri'] = automation_uri
-        automation_configuration.update({
-            'batches': get_batch_definitions(automation_configuration),
-            'display': get_display_configuration(automation_configuration),
-        })
-        automation_definitions.append(automation_configuration)
-    return automation_definitions
+def get_automation_definition(automation_configuration, automation_index):
+    'Return None if the configuration does not define an automation'
+    if 'output' not in automation_configuration:
+        return
+    automation_name = automation_configuration.get(
+        'name', make_automation_name(automation_index))
+    automation_slug = automation_configuration.get(
+        'slug', format_slug(automation_name))
+    automation_uri = AUTOMATION_ROUTE.format(
+        automation_slug=automation_slug)
+    automation_configuration['name'] = automation_name
+    automation_configuration['slug'] = automation_slug
+    automation_configuration['uri'] = automation_uri
+    automation_configuration.update({
+        'batches': get_batch_definitions(automation_configuration),
+        'display': get_display_configuration(automation_configuration),
+    })
+    return automation_configuration
 
 
 def get_automation_configurations(configuration):
@@ -171,8 +252,204 @@ def make_automation_name(automation_index):
     return AUTOMATION_NAME.replace('X', str(automation_index))
 
 
+class BatchDefinitions(Sequence):
+    '''
+    Chain batch definitions from the configuration and from batch files,
+    indexing slugs the first time that a batch is requested by slug and
+    names the first time that batches are filtered or sorted by name
+    '''
+
+    def __init__(self, parts=()):
+        self._parts = list(parts)
+        self._index_by_slug = None
+        self._name_packs = None
+        self._lock = Lock()
+
+    def extend(self, batch_definitions):
+        self._parts.append(batch_definitions)
+
+    def find(self, slug):
+        'Return the first batch definition with the slug or None'
+        with self._lock:
+            if self._index_by_slug is None:
+                index_by_slug = {}
+                for index, batch_slug in self._yield_key_packs(
+                        get_batch_slug):
+                    index_by_slug.setdefault(batch_slug, index)
+                self._index_by_slug = index_by_slug
+        try:
+            index = self._index_by_slug[slug]
+        except KeyError:
+            return
+        return self[index]
+
+    def search(self, text='', sort_key='', offset=0, limit=None):
+        '''
+        Return the number of batches whose names contain the text and a page
+        of their definitions, sorted by name if sort_key is name or -name
+        '''
+        if text or sort_key:
+            with self._lock:
+                if self._name_packs is None:
+                    self._name_packs = list(self._yield_key_packs(
+                        get_batch_name))
+            text = text.casefold()
+            name_packs = [_ for _ in self._name_packs if text in _[
+                1].casefold()] if text else self._name_packs
+            if sort_key:
+                name_packs = sorted(
+                    name_packs, key=lambda _: _[1].casefold(),
+                    reverse=sort_key.startswith('-'))
+            indices = [_[0] for _ in name_packs]
+        else:
+            indices = range(len(self))
+        end = None if limit is None else offset + limit
+        batch_definitions = []
+        for index in indices[offset:end]:
+            try:
+                batch_definitions.append(self[index])
+            except CrossComputeDataError as e:
+                L.error(e)
+        return len(indices), batch_definitions
+
+    def _yield_key_packs(self, get_key):
+        offset = 0
+        for part in self._parts:
+            if isinstance(part, CsvBatchDefinitions):
+                key_packs = part.yield_key_packs(get_key)
+            else:
+                key_packs = ((i, get_key(_, {})) for i, _ in enumerate(part))
+            for index, key in key_packs:
+                yield offset + index, key
+            offset += len(part)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[_] for _ in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if index >= 0:
+            for part in self._parts:
+                part_length = len(part)
+                if index < part_length:
+                    return part[index]
+                index -= part_length
+        raise IndexError('batch index out of range')
+
+    def __iter__(self):
+        return chain.from_iterable(self._parts)
+
+    def __len__(self):
+        return sum(len(_) for _ in self._parts)
+
+    def __getstate__(self):
+        return {'_parts': self._parts}
+
+    def __setstate__(self, state):
+        self.__init__(state['_parts'])
+
+
+class CsvBatchDefinitions(Sequence):
+    '''
+    Keep the byte offset of each valid row in a batch csv and format a batch
+    definition only when the row is requested
+    '''
+
+    def __init__(self, path, batch_definition, variable_definitions):
+        self.path = path
+        self.batch_definition = batch_definition
+        self.variable_definitions = variable_definitions
+        self._offsets = offsets = array('q')
+        try:
+            row_packs = yield_csv_row_packs(path)
+            self._set_keys(next(row_packs, (0, []))[1])
+            for index, (offset, data_by_id, error_message) in enumerate(
+                    self._parse_row_packs(row_packs)):
+                if error_message is not None:
+                    L.error(
+                        '%s in row %s of %s', error_message, index + 1,
+                        format_path(path))
+                    continue
+                offsets.append(offset)
+        except OSError:
+            raise CrossComputeConfigurationError(f'{path} path not found')
+
+    def yield_key_packs(self, get_key):
+        'Yield the index and key of each row without formatting the rest'
+        batch_definition = self.batch_definition
+        for index, data_by_id in self._yield_data_packs():
+            yield index, get_key(batch_definition, data_by_id)
+
+    def _yield_data_packs(self):
+        'Yield the index and data of each valid row in one pass'
+        try:
+            row_packs = yield_csv_row_packs(self.path)
+            next(row_packs, None)
+            index = 0
+            for offset, data_by_id, error_message in self._parse_row_packs(
+                    row_packs):
+                # Invalid rows were logged and left out when indexing
+                if error_message is not None:
+                    continue
+                yield index, data_by_id
+                index += 1
+        except OSError:
+            L.error('%s path not found', format_path(self.path))
+
+    def _parse_row_packs(self, row_packs):
+        '''
+        Yield the offset, data and error message of each row that is not
+        skipped, parsing a chunk of rows at a time by column
+        '''
+        keys = self._keys
+        # Resolve each view once for all chunks
+        variable_views = [VariableView.get_from(
+            _) for _ in self.variable_definitions]
+        row_packs = (_ for _ in row_packs if not self._is_skipped(_[1]))
+        while chunk := list(islice(row_packs, BATCH_CHUNK_ROW_COUNT)):
+            data_by_ids, error_by_index = parse_data_by_id_by_column(
+                keys, [_[1] for _ in chunk], variable_views)
+            for index, (offset, values) in enumerate(chunk):
+                yield offset, data_by_ids[index], error_by_index.get(index)
+
+    def _set_keys(self, values):
+        self._keys = keys = [_.strip() for _ in values]
+        self._comment_index = keys.index('#') if '#' in keys else None
+
+    def _is_skipped(self, values):
+        'Skip blank rows and rows commented with # in a column named #'
+        if not values:
+            return True
+        comment_index = self._comment_index
+        return comment_index is not None and comment_index < len(
+            values) and values[comment_index] == '#'
+
+    def _get_batch_definition(self, values):
+        data_by_id = parse_data_by_id(dict(zip(
+            self._keys, values)), self.variable_definitions)
+        return format_batch_definition(self.batch_definition, data_by_id)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[_] for _ in range(*index.indices(len(self)))]
+        try:
+            values = load_csv_row(self.path, self._offsets[index])
+        except OSError:
+            raise CrossComputeConfigurationError(
+                f'{self.path} path not found')
+        return self._get_batch_definition(values)
+
+    def __iter__(self):
+        batch_definition = self.batch_definition
+        for index, data_by_id in self._yield_data_packs():
+            yield format_batch_definition(batch_definition, data_by_id)
+
+    def __len__(self):
+        return len(self._offsets)
+
+
 def get_batch_definitions(configuration):
-    batch_definitions = []
+    batch_definitions = BatchDefinitions()
     automation_folder = configuration['folder']
     variable_definitions = get_variable_definitions(
         configuration, 'input')
@@ -276,6 +553,58 @@ def get_template_texts(configuration, mode_name):
     return template_texts
 
 
+def get_template_parts(configuration, mode_name):
+    '''
+    Get html fragments and variable slots for the mode template, compiling
+    the template only if its files changed since the last call.
+    '''
+    fingerprint = get_template_fingerprint(configuration, mode_name)
+    key = configuration['path'], mode_name
+    if key in TEMPLATE_CACHE:
+        old_fingerprint, template_parts = TEMPLATE_CACHE[key]
+        if old_fingerprint == fingerprint:
+            return template_parts
+    template_parts = compile_template('\n'.join(get_template_texts(
+        configuration, mode_name)))
+    TEMPLATE_CACHE[key] = fingerprint, template_parts
+    return template_parts
+
+
+def get_template_fingerprint(configuration, mode_name):
+    folder = configuration['folder']
+    mode_configuration = configuration.get(mode_name, {})
+    template_paths = [join(folder, _['path']) for _ in mode_configuration.get(
+        'templates', []) if 'path' in _]
+    variable_ids = [_['id'] for _ in get_variable_definitions(
+        configuration, mode_name) if 'id' in _]
+    return [variable_ids] + [get_path_fingerprint(_) for _ in template_paths]
+
+
+def compile_template(template_text):
+    'Render markdown once, leaving a slot for each variable'
+    slots = []
+
+    def mark(match):
+        terms = match.group(1).split('|')
+        slots.append({
+            'id': terms[0].strip(),
+            'function_names': terms[1:],
+            'text': match.group(0)})
+        return TEMPLATE_SLOT_MARK % (len(slots) - 1)
+
+    html = get_html_from_markdown(VARIABLE_ID_PATTERN.sub(
+        mark, template_text))
+    template_parts, html_index = [], 0
+    for match in TEMPLATE_SLOT_PATTERN.finditer(html):
+        template_parts.append(html[html_index:match.start()])
+        slot_index = match.group(1) or match.group(2)
+        template_parts.append(slots[int(slot_index)] | {
+            'is_paragraph': match.group(1) is not None})
+        html_index = match.end()
+    template_parts.append(html[html_index:])
+    return [_ for _ in template_parts if _]
+
+
 def normalize_batch_definition(batch_definition):
     try:
         batch_folder = get_scalar_text(batch_definition, 'folder')
@@ -294,28 +623,36 @@ def normalize_batch_definition(batch_definition):
 def get_batch_definitions_from_path(
         path, batch_definition, variable_definitions):
     file_extension = splitext(path)[1]
-    try:
-        yield_data_by_id = {
-            '.csv': yield_data_by_id_from_csv,
-            '.txt': yield_data_by_id_from_txt,
-        }[file_extension]
-    except KeyError:
+    if file_extension == '.csv':
+        return CsvBatchDefinitions(
+            path, batch_definition, variable_definitions)
+    if file_extension != '.txt':
         raise CrossComputeConfigurationError(
             f'{file_extension} not supported for batch configuration')
-    batch_folder = batch_definition['folder']
-    batch_name = batch_definition['name']
+    return [format_batch_definition(
+        batch_definition, data_by_id,
+    ) for data_by_id in yield_data_by_id_from_txt(path, variable_definitions)]
+
+
+def format_batch_definition(batch_definition, data_by_id):
+    slug = get_batch_slug(batch_definition, data_by_id)
+    return batch_definition | {
+        'folder': format_text(batch_definition['folder'], data_by_id),
+        'name': get_batch_name(batch_definition, data_by_id),
+        'slug': slug,
+        'uri': BATCH_ROUTE.format(batch_slug=slug),
+        'data_by_id': data_by_id}
+
+
+def get_batch_slug(batch_definition, data_by_id):
     batch_slug = batch_definition['slug']
-    batch_definitions = []
-    for data_by_id in yield_data_by_id(path, variable_definitions):
-        folder = format_text(batch_folder, data_by_id)
-        name = format_text(batch_name, data_by_id)
-        slug = format_text(
-            batch_slug, data_by_id) if batch_slug else format_slug(name)
-        batch_definitions.append(batch_definition | {
-            'folder': folder, 'name': name, 'slug': slug,
-            'uri': BATCH_ROUTE.format(batch_slug=slug),
-            'data_by_id': data_by_id})
-    return batch_definitions
+    if batch_slug:
+        return format_text(batch_slug, data_by_id)
+    return format_slug(get_batch_name(batch_definition, data_by_id))
+
+
+def get_batch_name(batch_definition, data_by_id):
+    return format_text(batch_definition['name'], data_by_id)
 
 
 def get_scalar_text(configuration, key, default=None):
@@ -328,4 +665,7 @@ def get_scalar_text(configuration, key, default=None):
     return value
 
 
+TEMPLATE_SLOT_MARK = 'crosscomputeslot%sx'
+TEMPLATE_SLOT_PATTERN = re.compile(
+    r'<p>crosscomputeslot(\d+)x</p>|crosscomputeslot(\d+)x')
 L = getLogger(__name__)
@@ -0,0 +1,384 @@
+import json
+import py_compile
+import re
+import shlex
+import sqlite3
+import sys
+from contextlib import contextmanager
+from invisibleroads_macros_log import format_path
+from logging import getLogger
+from os import makedirs, remove, scandir, walk
+from os.path import basename, dirname, exists, isfile, join, relpath
+from time import time
+
+from ..constants import (
+    ID_LENGTH,
+    RUN_REGISTRY_NAME,
+    RUN_REGISTRY_TIMEOUT_IN_SECONDS,
+    RUN_ROUTE)
+from ..exceptions import CrossComputeConfigurationError
+from ..macros.disk import (
+    get_hash,
+    get_path_fingerprint,
+    remove_old_folders)
+from ..macros.notebook import get_script_text
+
+
+class RunRegistry():
+    'Record runs on disk so that they stay addressable across restarts'
+
+    schema_text = '''
+PRAGMA journal_mode = WAL;
+CREATE TABLE IF NOT EXISTS run (
+    id TEXT PRIMARY KEY,
+    automation_slug TEXT NOT NULL,
+    status TEXT NOT NULL,
+    input_hash TEXT,
+    return_code INTEGER,
+    duration_in_seconds REAL,
+    creation_time REAL NOT NULL,
+    update_time REAL NOT NULL);
+CREATE INDEX IF NOT EXISTS run_automation_creation
+    ON run (automation_slug, creation_time);
+'''
+    order_text_by_sort_key = {
+        '': 'creation_time DESC',
+        '-time': 'creation_time DESC',
+        'time': 'creation_time',
+        'name': 'id',
+        '-name': 'id DESC',
+    }
+
+    def __init__(self, runs_folder):
+        self.runs_folder = runs_folder
+        self.path = join(runs_folder, RUN_REGISTRY_NAME)
+        self._is_ready = False
+
+    def add(self, automation_slug, run_id, input_hash=None, status='queued'):
+        'Register a run and return False if it exists already'
+        timestamp = time()
+        with self._connect() as connection:
+            cursor = connection.execute(
+                'INSERT INTO run (id, automation_slug, status, input_hash, '
+                'creation_time, update_time) VALUES (?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT (id) DO NOTHING', (
+                    run_id, automation_slug, status, input_hash, timestamp,
+                    timestamp))
+        return cursor.rowcount == 1
+
+    def requeue(self, run_id, statuses=('failed', 'timed out')):
+        'Queue the run again if it has one of the statuses'
+        with self._connect() as connection:
+            cursor = connection.execute(
+                "UPDATE run SET status = 'queued', return_code = NULL, "
+                'duration_in_seconds = NULL, update_time = ? '
+                'WHERE id = ? AND status IN (%s)' % ', '.join(
+                    '?' * len(statuses)), (time(), run_id) + tuple(statuses))
+        return cursor.rowcount == 1
+
+    def touch(self, run_id):
+        with self._connect() as connection:
+            connection.execute(
+                'UPDATE run SET update_time = ? WHERE id = ?', (
+                    time(), run_id))
+
+    def set_status(
+            self, run_id, status, return_code=None, duration_in_seconds=None):
+        with self._connect() as connection:
+            connection.execute(
+                'UPDATE run SET status = ?, return_code = ?, '
+                'duration_in_seconds = ?, update_time = ? WHERE id = ?', (
+                    status, return_code, duration_in_seconds, time(),
+                    run_id))
+
+    def remove(self, run_ids):
+        with self._connect() as connection:
+            connection.executemany(
+                'DELETE FROM run WHERE id = ?', [(_,) for _ in run_ids])
+
+    def get_run_definition(self, automation_slug, run_id):
+        with self._connect() as connection:
+            row = connection.execute(
+                'SELECT * FROM run WHERE id = ? AND automation_slug = ?', (
+                    run_id, automation_slug)).fetchone()
+        return None if row is None else self._get_run_definition(row)
+
+    def get_run_definitions(
+            self, automation_slug, offset=0, limit=None, text='',
+            sort_key=''):
+        '''
+        Get a page of runs whose names contain the text, newest first unless
+        sort_key is time, name or -name
+        '''
+        if not exists(self.path):
+            return []
+        where_text, where_values = self._get_where(automation_slug, text)
+        with self._connect() as connection:
+            rows = connection.execute(
+                f'SELECT * FROM run WHERE {where_text} '
+                f'ORDER BY {self.order_text_by_sort_key[sort_key]} '
+                'LIMIT ? OFFSET ?', where_values + (
+                    -1 if limit is None else limit, offset)).fetchall()
+        return [self._get_run_definition(_) for _ in rows]
+
+    def count_runs(self, automation_slug, text=''):
+        if not exists(self.path):
+            return 0
+        where_text, where_values = self._get_where(automation_slug, text)
+        with self._connect() as connection:
+            return connection.execute(
+                f'SELECT COUNT(*) FROM run WHERE {where_text}',
+                where_values).fetchone()[0]
+
+    def get_run_ids(self, statuses):
+        'Get the ids of runs in this folder that have one of the statuses'
+        if not exists(self.path):
+            return []
+        with self._connect() as connection:
+            rows = connection.execute(
+                'SELECT id FROM run WHERE status IN (%s)' % ', '.join(
+                    '?' * len(statuses)), tuple(statuses)).fetchall()
+        return [_[0] for _ in rows]
+
+    @contextmanager
+    def _connect(self):
+        if not self._is_ready:
+            makedirs(self.runs_folder, exist_ok=True)
+        connection = sqlite3.connect(
+            self.path, timeout=RUN_REGISTRY_TIMEOUT_IN_SECONDS)
+        connection.row_factory = sqlite3.Row
+        try:
+            if not self._is_ready:
+                connection.executescript(self.schema_text)
+                self._is_ready = True
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def _get_where(self, automation_slug, text):
+        if not text:
+            return 'automation_slug = ?', (automation_slug,)
+        pattern = '%' + re.sub(r'([\\%_])', r'\\\1', text) + '%'
+        return "automation_slug = ? AND id LIKE ? ESCAPE '\\'", (
+            automation_slug, pattern)
+
+    def _get_run_definition(self, row):
+        run_definition = dict(row)
+        run_id = run_definition['id']
+        return run_definition | {
+            'name': run_id,
+            'slug': run_id,
+            'folder': join(self.runs_folder, run_id),
+            'uri': RUN_ROUTE.format(run_slug=run_id),
+        }
+
+
+def get_cache_definition(automation_definition):
+    'Return cache settings if runs are cached, otherwise None'
+    script_definition = automation_definition.get('script', {})
+    cache_definition = script_definition.get('cache')
+    if not cache_definition:
+        return
+    if not isinstance(cache_definition, dict):
+        cache_definition = {}
+    return cache_definition
+
+
+def get_command_string(automation_definition):
+    'Get script.command or a command that runs script.path'
+    script_definition = automation_definition.get('script', {})
+    command_string = script_definition.get('command')
+    if command_string:
+        return command_string
+    script_path = get_script_path(automation_definition)
+    if not script_path:
+        return ''
+    if script_path.endswith('.ipynb'):
+        script_path = compile_notebook(script_path)
+    return shlex.join([sys.executable, script_path])
+
+
+def get_script_path(automation_definition):
+    script_definition = automation_definition.get('script', {})
+    script_path = script_definition.get('path')
+    if not script_path:
+        return ''
+    return join(automation_definition['folder'], script_definition.get(
+        'folder', '.'), script_path)
+
+
+def compile_notebook(notebook_path):
+    'Convert a notebook into a bytecode script once per notebook version'
+    path, modification_time, size = get_path_fingerprint(notebook_path)
+    if size is None:
+        raise CrossComputeConfigurationError(f'{notebook_path} not found')
+    cache_folder = join(dirname(notebook_path), '__pycache__')
+    script_name = basename(notebook_path)
+    script_stem = script_name + '.' + get_hash([
+        str(modification_time), str(size), sys.implementation.cache_tag,
+    ])[:ID_LENGTH]
+    target_path = join(cache_folder, script_stem + '.pyc')
+    if exists(target_path):
+        return target_path
+    try:
+        script_text = get_script_text(notebook_path)
+    except (OSError, UnicodeDecodeError, ValueError) as e:
+        raise CrossComputeConfigurationError(
+            f'{notebook_path} could not be read as a notebook: {e}')
+    makedirs(cache_folder, exist_ok=True)
+    source_path = join(cache_folder, script_stem + '.py')
+    with open(source_path, 'wt') as source_file:
+        source_file.write(script_text)
+    try:
+        py_compile.compile(source_path, target_path, doraise=True)
+    except py_compile.PyCompileError as e:
+        raise CrossComputeConfigurationError(
+            f'{notebook_path} could not be compiled: {e.msg}')
+    for entry in scandir(cache_folder):
+        name = entry.name
+        if name.startswith(script_name + '.') and script_stem not in name:
+            remove(entry.path)
+    L.debug('%s compiled', format_path(notebook_path))
+    return target_path
+
+
+def get_script_limits(automation_definition):
+    'Return the timeout and rlimits configured in script.limits'
+    limits_definition = automation_definition.get('script', {}).get(
+        'limits') or {}
+    try:
+        timeout_in_seconds = limits_definition.get('timeout_in_seconds')
+        if timeout_in_seconds is not None:
+            timeout_in_seconds = float(timeout_in_seconds)
+        limit_by_resource_name = {}
+        for key, (resource_name, multiplier) in {
+            'maximum_cpu_in_seconds': ('RLIMIT_CPU', 1),
+            'maximum_memory_in_megabytes': ('RLIMIT_AS', 1024 * 1024),
+            'maximum_file_count': ('RLIMIT_NOFILE', 1),
+        }.items():
+            if key in limits_definition:
+                limit_by_resource_name[resource_name] = int(
+                    limits_definition[key]) * multiplier
+    except (TypeError, ValueError):
+        raise CrossComputeConfigurationError(
+            'script limits must be numbers')
+    return timeout_in_seconds, limit_by_resource_name
+
+
+def get_run_hash(
+        automation_definition, data_by_id, custom_environment=None,
+        input_folder=None):
+    script_definition = automation_definition.get('script', {})
+    paths = get_script_paths(automation_definition)
+    texts = [
+        script_definition.get('command', ''),
+        format_data_text(data_by_id),
+        format_data_text(custom_environment or {})]
+    if input_folder:
+        input_paths = get_paths_from_folder(input_folder)
+        texts.extend(relpath(_, input_folder) for _ in input_paths)
+        paths.extend(input_paths)
+    return get_hash(texts, paths)
+
+
+def get_batch_fingerprint(
+        automation_definition, batch_definition, custom_environment):
+    'Hash inputs, environment and script; include input files if no data'
+    data_by_id = batch_definition.get('data_by_id', {})
+    input_folder = None if data_by_id else join(
+        automation_definition['folder'], batch_definition['folder'], 'input')
+    return get_run_hash(
+        automation_definition, data_by_id, custom_environment, input_folder)
+
+
+def load_fingerprint(batch_folder):
+    try:
+        with open(get_fingerprint_path(batch_folder), 'rt') as f:
+            fingerprint = f.read().strip()
+    except OSError:
+        fingerprint = ''
+    return fingerprint
+
+
+def save_fingerprint(batch_folder, fingerprint):
+    with open(get_fingerprint_path(batch_folder), 'wt') as f:
+        f.write(fingerprint)
+
+
+def remove_fingerprint(batch_folder):
+    try:
+        remove(get_fingerprint_path(batch_folder))
+    except OSError:
+        pass
+
+
+def get_fingerprint_path(batch_folder):
+    return join(batch_folder, 'debug', 'fingerprint.txt')
+
+
+def get_script_paths(automation_definition):
+    'Get paths to the configuration and to files used by the script'
+    script_definition = automation_definition.get('script', {})
+    script_folder = join(
+        automation_definition['folder'], script_definition.get('folder', '.'))
+    command_string = script_definition.get('command', '')
+    try:
+        terms = shlex.split(command_string)
+    except ValueError:
+        terms = command_string.split()
+    paths = [automation_definition['path']]
+    for term in terms:
+        path = join(script_folder, term)
+        if isfile(path):
+            paths.append(path)
+    script_path = get_script_path(automation_definition)
+    if script_path and isfile(script_path):
+        paths.append(script_path)
+    function_string = script_definition.get('function')
+    if function_string:
+        module_string = function_string.rsplit('.', maxsplit=1)[0]
+        path = join(script_folder, *module_string.split('.')) + '.py'
+        if isfile(path):
+            paths.append(path)
+    return paths
+
+
+def get_paths_from_folder(folder):
+    paths = []
+    for root_folder, folder_names, file_names in walk(folder):
+        paths.extend(join(root_folder, _) for _ in file_names)
+    return sorted(paths)
+
+
+def format_data_text(data_by_id):
+    return json.dumps({
+        str(k): v for k, v in data_by_id.items()
+    }, sort_keys=True, default=str)
+
+
+def clean_runs(automation_definition, excluded_folders=()):
+    cache_definition = get_cache_definition(automation_definition) or {}
+    maximum_age_in_seconds = cache_definition.get('maximum_age_in_seconds')
+    maximum_size_in_megabytes = cache_definition.get(
+        'maximum_size_in_megabytes')
+    if maximum_age_in_seconds is None and maximum_size_in_megabytes is None:
+        return []
+    runs_folder = join(automation_definition['folder'], 'runs')
+    run_registry = RunRegistry(runs_folder)
+    # Keep runs that are waiting in the queue or still running
+    excluded_folders = set(excluded_folders) | {join(
+        runs_folder, _) for _ in run_registry.get_run_ids([
+            'queued', 'running'])}
+    removed_folders = remove_old_folders(
+        runs_folder, maximum_age_in_seconds,
+        None if maximum_size_in_megabytes is None else
+        maximum_size_in_megabytes * 1024 * 1024, excluded_folders)
+    for folder in removed_folders:
+        L.debug('%s removed', format_path(folder))
+    if removed_folders:
+        run_registry.remove([basename(_) for _ in removed_folders])
+    return removed_folders
+
+
+L = getLogger(__name__)
@@ -1,5 +1,5 @@
-import csv
 import json
+from functools import cache
 from importlib.metadata import entry_points
 from invisibleroads_macros_log import format_path
 from logging import getLogger
@@ -12,6 +12,7 @@ from ..constants import (
 from ..exceptions import (
     CrossComputeConfigurationError,
     CrossComputeDataError)
+from ..macros.disk import get_path_fingerprint
 from ..macros.package import import_attribute
 from ..macros.web import get_html_from_markdown
 
@@ -31,7 +32,7 @@ class VariableView():
     def get_from(Class, variable_definition):
         view_name = variable_definition['view']
         try:
-            View = VIEW_BY_NAME[view_name]
+            View = get_view_class(view_name)
         except KeyError:
             L.error('%s view not installed', view_name)
             View = Class
@@ -45,6 +46,18 @@ class VariableView():
     def parse(self, data):
         return data
 
+    def parse_column(self, values):
+        'Parse values, returning the data and an error message by row index'
+        data, error_by_index = [], {}
+        parse = self.parse
+        for index, value in enumerate(values):
+            try:
+                value = parse(value)
+            except CrossComputeDataError as e:
+                error_by_index[index] = str(e)
+            data.append(value)
+        return data, error_by_index
+
     def render(self, mode_name, element_id, function_names, request_path):
         if mode_name == 'input':
             render = self.render_input
@@ -238,8 +251,9 @@ def load_variable_data(path, variable_id):
     except OSError:
         new_time = None
     key = path, variable_id
-    if key in VARIABLE_CACHE:
-        old_time, variable_value = VARIABLE_CACHE[key]
+    variable_pack = VARIABLE_CACHE.get(key)
+    if variable_pack is not None:
+        old_time, variable_value = variable_pack
         if old_time == new_time:
             return variable_value
     file_extension = splitext(path)[1]
@@ -248,17 +262,31 @@ def load_variable_data(path, variable_id):
             if file_extension == '.dictionary':
                 value_by_id = json.load(file)
                 for i, v in value_by_id.items():
-                    VARIABLE_CACHE[(path, i)] = new_time, v
+                    VARIABLE_CACHE.set((path, i), (new_time, v))
                 value = value_by_id[variable_id]
             else:
                 value = file.read().rstrip()
     except Exception:
         L.warning(f'could not load {variable_id} from {path}')
         value = ''
-    VARIABLE_CACHE[(path, variable_id)] = new_time, value
+    VARIABLE_CACHE.set((path, variable_id), (new_time, value))
     return value
 
 
+def get_variable_fingerprint(variable_definitions, absolute_batch_folder):
+    fingerprint = []
+    for variable_definition in variable_definitions:
+        folder = join(absolute_batch_folder, variable_definition['mode'])
+        fingerprint.append(get_path_fingerprint(join(
+            folder, variable_definition['path'])))
+        configuration_path = variable_definition.get(
+            'configuration', {}).get('path')
+        if configuration_path:
+            fingerprint.append(get_path_fingerprint(join(
+                folder, configuration_path)))
+    return fingerprint
+
+
 def get_variable_data_by_id(variable_definitions, data_by_id):
     variable_data_by_id = {}
     for variable_definition in variable_definitions:
@@ -275,21 +303,6 @@ def get_variable_data_by_id(variable_definitions, data_by_id):
     return variable_data_by_id
 
 
-def yield_data_by_id_from_csv(path, variable_definitions):
-    try:
-        with open(path, 'rt') as file:
-            csv_reader = csv.reader(file)
-            keys = [_.strip() for _ in next(csv_reader)]
-            for values in csv_reader:
-                data_by_id = parse_data_by_id(dict(zip(
-                    keys, values)), variable_definitions)
-                if data_by_id.get('#') == '#':
-                    continue
-                yield data_by_id
-    except OSError:
-        raise CrossComputeConfigurationError(f'{path} path not found')
-
-
 def yield_data_by_id_from_txt(path, variable_definitions):
     if len(variable_definitions) > 1:
         raise CrossComputeConfigurationError(
@@ -328,6 +341,36 @@ def parse_data_by_id(data_by_id, variable_definitions):
     return data_by_id
 
 
+def parse_data_by_id_by_column(keys, rows, variable_views):
+    '''
+    Parse rows of values one column at a time, returning a data dictionary
+    for each row and an error message by row index
+    '''
+    data_by_ids = [dict(zip(keys, _)) for _ in rows]
+    error_by_index = {}
+    for variable_view in variable_views:
+        variable_id = variable_view.variable_id
+        try:
+            column_index = keys.index(variable_id)
+        except ValueError:
+            return data_by_ids, dict.fromkeys(
+                range(len(rows)), f'{variable_id} required')
+        indices, values = [], []
+        for index, row in enumerate(rows):
+            if column_index < len(row):
+                indices.append(index)
+                values.append(row[column_index])
+            else:
+                error_by_index.setdefault(index, f'{variable_id} required')
+        data, column_error_by_index = variable_view.parse_column(values)
+        for index, variable_data in zip(indices, data):
+            data_by_ids[index][variable_id] = variable_data
+        for index, error_message in column_error_by_index.items():
+            error_by_index.setdefault(
+                indices[index], f'{error_message} for variable {variable_id}')
+    return data_by_ids, error_by_index
+
+
 def format_text(text, data_by_id):
     if not data_by_id:
         return text
@@ -366,6 +409,20 @@ def apply_functions(value, function_names, function_by_name):
     return value
 
 
-VIEW_BY_NAME = {_.name: import_attribute(_.value) for _ in entry_points()[
-    'crosscompute.views']}
+def get_view_class(view_name):
+    'Import the view from its entry point the first time it is used'
+    try:
+        View = VIEW_BY_NAME[view_name]
+    except KeyError:
+        View = VIEW_BY_NAME[view_name] = import_attribute(
+            get_view_entry_point_by_name()[view_name].value)
+    return View
+
+
+@cache
+def get_view_entry_point_by_name():
+    return {_.name: _ for _ in entry_points()['crosscompute.views']}
+
+
+VIEW_BY_NAME = {}
 L = getLogger(__name__)
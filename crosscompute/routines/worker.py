@@ -0,0 +1,176 @@
+import json
+import os
+import subprocess
+import sys
+import traceback
+from functools import partial
+from importlib import import_module
+from logging import getLogger
+from os.path import join
+from threading import Event, Timer
+
+from ..constants import FUNCTION_WORKER_BY_KEY
+from ..macros.disk import get_path_fingerprint
+from ..macros.package import import_attribute
+from ..macros.process import kill_process_group, set_resource_limits
+from .run import get_script_paths
+
+
+class FunctionWorker():
+    '''
+    Keep a Python process that imports script.imports once and then calls
+    script.function for each run, saving interpreter startup per run.
+    '''
+
+    def __init__(
+            self, function_string, import_strings, folder,
+            limit_by_resource_name=None):
+        self.function_string = function_string
+        self.import_strings = import_strings
+        self.folder = folder
+        self.limit_by_resource_name = limit_by_resource_name
+        self._process = None
+
+    def run(
+            self, mode_folder_by_name, environment, o_path, e_path,
+            timeout_in_seconds=None):
+        'Return exit code or raise subprocess.TimeoutExpired after a timeout'
+        process = self._get_process()
+        is_expired = Event()
+
+        def expire():
+            is_expired.set()
+            kill_process_group(process)
+
+        timer = None if timeout_in_seconds is None else Timer(
+            timeout_in_seconds, expire)
+        try:
+            process.stdin.write(json.dumps({
+                'mode_folder_by_name': mode_folder_by_name,
+                'environment': environment,
+                'o_path': o_path,
+                'e_path': e_path,
+            }) + '\n')
+            process.stdin.flush()
+            if timer:
+                timer.start()
+            line = process.stdout.readline()
+        except OSError:
+            line = ''
+        finally:
+            if timer:
+                timer.cancel()
+        if line:
+            try:
+                return json.loads(line)['return_code']
+            except (ValueError, KeyError, TypeError):
+                # The protocol is out of step, so start a fresh worker
+                L.error(
+                    'worker for %s sent %r', self.function_string, line)
+                kill_process_group(process)
+                self._process = None
+                return 1
+        self._process = None
+        if is_expired.is_set():
+            raise subprocess.TimeoutExpired(
+                self.function_string, timeout_in_seconds)
+        return process.wait()
+
+    def stop(self):
+        if self._process is None:
+            return
+        kill_process_group(self._process)
+        self._process = None
+
+    def _get_process(self):
+        process = self._process
+        if process is None or process.poll() is not None:
+            L.info('starting worker for %s', self.function_string)
+            kwargs = {}
+            if self.limit_by_resource_name:
+                kwargs['preexec_fn'] = partial(
+                    set_resource_limits, self.limit_by_resource_name)
+            process = self._process = subprocess.Popen([
+                sys.executable, '-m', __name__, self.function_string,
+            ] + list(self.import_strings), cwd=self.folder,
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True,
+                start_new_session=True, **kwargs)
+        return process
+
+
+def get_function_worker(automation_definition, limit_by_resource_name=None):
+    'Get the worker for an automation, restarting it if its script changed'
+    script_definition = automation_definition.get('script', {})
+    function_string = script_definition['function']
+    import_strings = script_definition.get('imports', [])
+    key = automation_definition['path'], automation_definition['slug']
+    fingerprint = [function_string, import_strings, limit_by_resource_name, [
+        get_path_fingerprint(_) for _ in get_script_paths(
+            automation_definition)]]
+    try:
+        old_fingerprint, worker = FUNCTION_WORKER_BY_KEY[key]
+    except KeyError:
+        pass
+    else:
+        if fingerprint == old_fingerprint:
+            return worker
+        worker.stop()
+    worker = FunctionWorker(function_string, import_strings, join(
+        automation_definition['folder'], script_definition.get(
+            'folder', '.')), limit_by_resource_name)
+    FUNCTION_WORKER_BY_KEY[key] = fingerprint, worker
+    return worker
+
+
+def serve(function_string, import_strings):
+    'Run tasks from stdin and report exit codes on the original stdout'
+    folder = os.getcwd()
+    sys.path.insert(0, folder)
+    result_file = os.fdopen(os.dup(1), 'wt')
+    # Keep prints at import time out of the result pipe
+    os.dup2(2, 1)
+    try:
+        for import_string in import_strings:
+            import_module(import_string)
+        function = import_attribute(function_string)
+    except Exception:
+        function, error_text = None, traceback.format_exc()
+    for line in sys.stdin:
+        task = json.loads(line)
+        os.chdir(folder)
+        os.environ.clear()
+        os.environ.update(task['environment'])
+        with open(task['o_path'], 'wt') as o_file, open(
+                task['e_path'], 'wt') as e_file:
+            os.dup2(o_file.fileno(), 1)
+            os.dup2(e_file.fileno(), 2)
+            if function is None:
+                sys.stderr.write(error_text)
+                return_code = 1
+            else:
+                return_code = run_task(function, task['mode_folder_by_name'])
+            sys.stdout.flush()
+            sys.stderr.flush()
+        result_file.write(json.dumps({'return_code': return_code}) + '\n')
+        result_file.flush()
+
+
+def run_task(function, mode_folder_by_name):
+    try:
+        function(**mode_folder_by_name)
+    except SystemExit as e:
+        return_code = e.code if isinstance(e.code, int) else int(
+            e.code is not None)
+    except Exception:
+        traceback.print_exc()
+        return_code = 1
+    else:
+        return_code = 0
+    return return_code
+
+
+L = getLogger(__name__)
+
+
+if __name__ == '__main__':
+    serve(sys.argv[1], sys.argv[2:])
@@ -14,6 +14,7 @@ from crosscompute.scripts.configure import (
     configure_with)
 from crosscompute.scripts.run import (
     configure_argument_parser_for_running,
+    configure_argument_parser_for_working,
     run_with)
 from crosscompute.scripts.serve import (
     configure_argument_parser_for_serving,
@@ -25,6 +26,7 @@ def do():
     configure_argument_parser_for_logging(a)
     configure_argument_parser_for_launching(a)
     configure_argument_parser_for_configuring(a)
+    configure_argument_parser_for_working(a)
     configure_argument_parser_for_serving(a)
     configure_argument_parser_for_running(a)
     args = a.parse_args()
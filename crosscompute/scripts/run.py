@@ -16,6 +16,7 @@ def do():
     a = ArgumentParser()
     configure_argument_parser_for_logging(a)
     configure_argument_parser_for_configuring(a)
+    configure_argument_parser_for_working(a)
     configure_argument_parser_for_running(a)
     args = a.parse_args()
     configure_logging_from(args)
@@ -27,7 +28,17 @@ def do():
     run_with(automation, args)
 
 
+def configure_argument_parser_for_working(a):
+    a.add_argument(
+        '--workers', metavar='X', type=int,
+        dest='worker_count',
+        help='number of processes to use for running batches or queued runs')
+
+
 def configure_argument_parser_for_running(a):
+    a.add_argument(
+        '--incremental', dest='is_incremental', action='store_true',
+        help='skip batches whose inputs and script have not changed')
     # TODO: Implement clean
     '''
     a.add_argument(
@@ -38,7 +49,9 @@ def configure_argument_parser_for_running(a):
 
 def run_with(automation, args):
     try:
-        automation.run()
+        automation.run(
+            worker_count=args.worker_count,
+            is_incremental=args.is_incremental)
     except CrossComputeError as e:
         L.error(e)
     except KeyboardInterrupt:
@@ -6,7 +6,9 @@ from crosscompute.constants import (
     DISK_DEBOUNCE_IN_MILLISECONDS,
     DISK_POLL_IN_MILLISECONDS,
     HOST,
-    PORT)
+    PORT,
+    SERVER_BACKEND,
+    SERVER_BACKENDS)
 from crosscompute.exceptions import (
     CrossComputeError)
 from crosscompute.macros.web import is_port_in_use, open_browser
@@ -16,12 +18,15 @@ from crosscompute.routines.log import (
     configure_logging_from)
 from crosscompute.scripts.configure import (
     configure_argument_parser_for_configuring)
+from crosscompute.scripts.run import (
+    configure_argument_parser_for_working)
 
 
 def do():
     a = ArgumentParser()
     configure_argument_parser_for_logging(a)
     configure_argument_parser_for_configuring(a)
+    configure_argument_parser_for_working(a)
     configure_argument_parser_for_serving(a)
     args = a.parse_args()
     configure_logging_from(args)
@@ -51,6 +56,9 @@ def configure_argument_parser_for_serving(a):
     a.add_argument(
         '--production', dest='is_production', action='store_true',
         help='disable server restart on file change')
+    a.add_argument(
+        '--watch-batches', dest='is_watching_batches', action='store_true',
+        help='update pages when batch files change')
     a.add_argument(
         '--disk-poll', metavar='X', type=int,
         default=DISK_POLL_IN_MILLISECONDS,
@@ -63,6 +71,10 @@ def configure_argument_parser_for_serving(a):
         '--base-uri', metavar='X',
         default='',
         help='specify base uri for all routes')
+    a.add_argument(
+        '--backend', metavar='X',
+        default=SERVER_BACKEND, choices=SERVER_BACKENDS,
+        help='specify waitress or uvicorn, which needs pip install uvicorn')
 
 
 def serve_with(automation, args):
@@ -81,7 +93,10 @@ def serve_with(automation, args):
             is_production=args.is_production,
             disk_poll_in_milliseconds=args.disk_poll,
             disk_debounce_in_milliseconds=args.disk_debounce,
-            base_uri=base_uri)
+            base_uri=base_uri,
+            worker_count=args.worker_count or 1,
+            backend=args.backend,
+            is_watching_batches=args.is_watching_batches)
     except CrossComputeError as e:
         L.error(e)
     except KeyboardInterrupt:
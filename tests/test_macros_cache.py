@@ -0,0 +1,31 @@
+from crosscompute.macros.cache import LRUCache, estimate_size
+
+
+def test_lru_cache():
+    cache = LRUCache(maximum_length=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+    assert 'a' in cache
+    assert 'b' not in cache
+    assert cache.get('b', 0) == 0
+    assert len(cache) == 2
+    assert cache.hit_count == 1
+    assert cache.miss_count == 1
+
+
+def test_lru_cache_with_maximum_size():
+    cache = LRUCache(
+        maximum_length=10, maximum_size_in_bytes=10, get_size=len)
+    cache.set('a', 'x' * 6)
+    cache.set('b', 'x' * 6)
+    assert 'a' not in cache
+    assert cache.size_in_bytes == 6
+    cache.set('c', 'x' * 11)
+    assert 'c' not in cache
+    assert cache.size_in_bytes == 6
+
+
+def test_estimate_size():
+    assert estimate_size({'a': 'x' * 100}) > estimate_size({'a': 'x'})
@@ -0,0 +1,33 @@
+from os import makedirs, utime
+from os.path import exists, join
+from time import time
+
+from crosscompute.macros.disk import (
+    get_hash,
+    remove_old_folders)
+
+
+def test_get_hash(tmp_path):
+    path = tmp_path / 'x.txt'
+    path.write_text('x')
+    assert get_hash(['a'], [path]) == get_hash(['a'], [path])
+    assert get_hash(['a'], [path]) != get_hash(['b'], [path])
+    old_hash = get_hash(['a'], [path])
+    path.write_text('y')
+    assert get_hash(['a'], [path]) != old_hash
+
+
+def test_remove_old_folders(tmp_path):
+    folders = []
+    for index in range(3):
+        folder = join(tmp_path, str(index))
+        makedirs(folder)
+        open(join(folder, 'x.txt'), 'wt').write('x' * 10)
+        t = time() - (3 - index) * 100
+        utime(folder, (t, t))
+        folders.append(folder)
+    assert remove_old_folders(tmp_path, maximum_age_in_seconds=250) == [
+        folders[0]]
+    assert remove_old_folders(tmp_path, maximum_size_in_bytes=10) == [
+        folders[1]]
+    assert exists(folders[2])
@@ -1,7 +1,14 @@
-from crosscompute.macros.iterable import extend_uniquely
+from crosscompute.macros.iterable import extend_uniquely, index_by
 
 
 def test_extend_uniquely():
     items = [1, 2]
     extend_uniquely(items, [2, 3])
     assert len(items) == 3
+
+
+def test_index_by():
+    items = [{'slug': 'A', 'x': 1}, {'slug': 'a', 'x': 2}, {'x': 3}]
+    item_by_slug = index_by(items, 'slug', normalize=str.casefold)
+    assert list(item_by_slug) == ['a']
+    assert item_by_slug['a']['x'] == 1
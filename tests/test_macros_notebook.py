@@ -0,0 +1,35 @@
+import json
+
+from crosscompute.macros.notebook import get_script_text
+
+
+def test_get_script_text(tmp_path):
+    path = tmp_path / 'x.ipynb'
+    path.write_text(json.dumps({'cells': [
+        {'cell_type': 'markdown', 'source': ['# Title']},
+        {'cell_type': 'code', 'source': ['%matplotlib inline\n', 'x = 1']},
+        {'cell_type': 'code', 'source': 'if x:\n    !ls\n'},
+        {'cell_type': 'code', 'source': ['%%bash\n', 'echo 1']},
+    ]}))
+    script_text = get_script_text(path)
+    assert '# Title' not in script_text
+    assert 'pass  # %matplotlib inline\nx = 1' in script_text
+    assert 'if x:\n    pass  # !ls' in script_text
+    assert 'pass  # echo 1' in script_text
+    compile(script_text, str(path), 'exec')
+
+
+def test_get_script_text_keeps_percent_inside_statements(tmp_path):
+    path = tmp_path / 'x.ipynb'
+    path.write_text(json.dumps({'cells': [
+        {'cell_type': 'code', 'source': 'v = (10\n     % 3)\n%time v\n'},
+        {'cell_type': 'code', 'source': (
+            'q = """\nselect *\n%s\n!x\n"""\n!ls\n')},
+    ]}))
+    script_text = get_script_text(path)
+    assert 'v = (10\n     % 3)\npass  # %time v' in script_text
+    assert 'q = """\nselect *\n%s\n!x\n"""\npass  # !ls' in script_text
+    namespace = {}
+    exec(compile(script_text, str(path), 'exec'), namespace)
+    assert namespace['v'] == 1
+    assert namespace['q'] == '\nselect *\n%s\n!x\n'
@@ -0,0 +1,26 @@
+import subprocess
+import sys
+from pytest import mark, raises
+from time import time
+
+from crosscompute.macros.process import run_process
+
+
+def test_run_process(tmp_path):
+    assert run_process([sys.executable, '-c', 'exit(3)']) == 3
+
+    path = tmp_path / 'x.txt'
+    start_time = time()
+    with raises(subprocess.TimeoutExpired):
+        run_process(f'sleep 5 && touch {path}', 0.5, shell=True)
+    assert time() - start_time < 3
+    assert not path.exists()
+
+
+@mark.skipif(sys.platform == 'win32', reason='requires resource')
+def test_run_process_with_limits():
+    assert run_process([
+        sys.executable, '-c',
+        'import resource, sys; '
+        'sys.exit(resource.getrlimit(resource.RLIMIT_NOFILE)[0])',
+    ], limit_by_resource_name={'RLIMIT_NOFILE': 42}) == 42
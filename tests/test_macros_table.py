@@ -0,0 +1,10 @@
+from crosscompute.macros.table import load_csv_row, yield_csv_row_packs
+
+
+def test_yield_csv_row_packs(tmp_path):
+    path = tmp_path / 'x.csv'
+    path.write_bytes('a,b\r\n1,"x\ny"\n\n2,é\n'.encode('utf-8'))
+    packs = list(yield_csv_row_packs(path))
+    assert [_[1] for _ in packs] == [['a', 'b'], ['1', 'x\ny'], [], ['2', 'é']]
+    for offset, values in packs:
+        assert load_csv_row(path, offset) == values
@@ -0,0 +1,25 @@
+import sys
+from pytest import mark
+from threading import Timer
+
+from crosscompute.macros.watch import InotifyWatcher, PollingWatcher
+
+
+@mark.parametrize('Watcher', [PollingWatcher, mark.skipif(
+    not sys.platform.startswith('linux'), reason='requires inotify',
+)(InotifyWatcher)])
+def test_watcher(tmp_path, Watcher):
+    watched_path = tmp_path / 'x.txt'
+    ignored_path = tmp_path / 'y.txt'
+    watched_path.write_text('x')
+    watcher = Watcher([str(watched_path)], 50, 100)
+
+    def change():
+        ignored_path.write_text('y')
+        watched_path.write_text('xx')
+
+    Timer(0.2, change).start()
+    try:
+        assert next(iter(watcher)) == {str(watched_path)}
+    finally:
+        watcher.close()
@@ -1,6 +1,7 @@
 from crosscompute.macros.web import (
     format_slug,
-    get_html_from_markdown)
+    get_html_from_markdown,
+    is_block_html)
 
 
 def test_format_slug():
@@ -12,3 +13,8 @@ def test_get_html_from_markdown():
     assert not html.startswith('<p>') and not html.endswith('</p>')
     html = get_html_from_markdown('x\n\nx')
     assert html.startswith('<p>') and html.endswith('</p>')
+
+
+def test_is_block_html():
+    assert is_block_html('<div id="v0"></div>')
+    assert not is_block_html('<span id="v0"></span>')
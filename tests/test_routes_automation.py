@@ -0,0 +1,33 @@
+from pyramid.httpexceptions import HTTPBadRequest
+from pytest import raises
+
+from crosscompute.constants import BATCH_SORT_KEYS, PAGE_SIZE
+from crosscompute.routes.automation import get_listing, get_listing_options
+
+
+def test_get_listing_options():
+    assert get_listing_options({}, 'batch_', BATCH_SORT_KEYS) == (
+        '', '', 1, PAGE_SIZE)
+    assert get_listing_options({
+        'batch_query': ' a ', 'batch_sort': '-name', 'batch_page': '2',
+        'batch_size': '10', 'query': 'b',
+    }, 'batch_', BATCH_SORT_KEYS) == ('a', '-name', 2, 10)
+    for params in [
+            {'sort': 'time'}, {'page': 'x'}, {'page': '0'}, {'size': '0'},
+            {'size': '1001'}]:
+        with raises(HTTPBadRequest):
+            get_listing_options(params, '', BATCH_SORT_KEYS)
+
+
+def test_get_listing():
+    params = {'run_query': 'a', 'run_page': '2'}
+    listing = get_listing(
+        params, 'run_', ['x'], 21, 'a', '', BATCH_SORT_KEYS, 2, 10)
+    assert listing['count'] == 21
+    assert listing['page_count'] == 3
+    assert listing['previous_page_query'] == '?run_query=a&run_page=1'
+    assert listing['next_page_query'] == '?run_query=a&run_page=3'
+    listing = get_listing({}, '', [], 0, '', '', BATCH_SORT_KEYS, 1, 10)
+    assert listing['page_count'] == 1
+    assert listing['previous_page_query'] == ''
+    assert listing['next_page_query'] == ''
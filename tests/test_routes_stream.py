@@ -0,0 +1,19 @@
+from multiprocessing import Value
+
+from crosscompute.routes.stream import StreamRoutes
+
+
+def test_see_streams_with_maximum_stream_count():
+    stream_routes = StreamRoutes(Value('d', 1), maximum_stream_count=1)
+    response = stream_routes.see_streams(None)
+    assert response.status_code == 200
+    assert next(iter(response.app_iter)) == b'data: {"t": 1.0}\n\n'
+    busy_response = stream_routes.see_streams(None)
+    assert busy_response.status_code == 503
+    assert busy_response.body.startswith(b'retry: ')
+    response.app_iter.close()
+    response = stream_routes.see_streams(None)
+    assert response.status_code == 200
+    # Release a stream that the server closes before iterating
+    response.app_iter.close()
+    assert stream_routes.see_streams(None).status_code == 200
@@ -0,0 +1,138 @@
+import json
+from os.path import join
+from queue import Queue
+
+from crosscompute.routines.automation import Automation, run_automation
+from crosscompute.routines.run import RunRegistry
+
+
+def test_run_notebook_with_sibling_module(tmp_path):
+    (tmp_path / 'automate.yml').write_text(
+        'crosscompute: 0.9.0\n'
+        'version: 0.1.0\n'
+        'output:\n'
+        '  variables:\n'
+        '    - id: y\n'
+        '      view: number\n'
+        '      path: y.txt\n'
+        'batches:\n'
+        '  - folder: batches/standard\n'
+        'script:\n'
+        '  path: run.ipynb\n')
+    (tmp_path / 'helpers.py').write_text('Y = 7\n')
+    (tmp_path / 'run.ipynb').write_text(json.dumps({'cells': [{
+        'cell_type': 'code', 'source': [
+            'from helpers import Y\n',
+            'from os import environ\n',
+            "open(environ['CROSSCOMPUTE_OUTPUT_FOLDER'] + '/y.txt', 'wt')"
+            '.write(str(Y))'],
+    }]}))
+    Automation.load(str(tmp_path)).run()
+    output_path = tmp_path / 'batches' / 'standard' / 'output' / 'y.txt'
+    assert output_path.read_text() == '7'
+
+
+def test_run_automation_status(tmp_path):
+    (tmp_path / 'automate.yml').write_text(
+        'crosscompute: 0.9.0\n'
+        'version: 0.1.0\n'
+        'output:\n'
+        '  variables:\n'
+        '    - id: y\n'
+        '      view: number\n'
+        '      path: y.txt\n'
+        'batches:\n'
+        '  - folder: batches/standard\n'
+        'script:\n'
+        '  command: python run.py\n'
+        '  limits:\n'
+        '    timeout_in_seconds: 1\n')
+    automation_definition = Automation.load(str(tmp_path)).definitions[0]
+    batch_definition = automation_definition['batches'][0]
+    run_path = tmp_path / 'run.py'
+    run_path.write_text('raise SystemExit(124)\n')
+    assert run_automation(automation_definition, batch_definition) == (
+        'failed', 124)
+    run_path.write_text('import time; time.sleep(5)\n')
+    assert run_automation(automation_definition, batch_definition) == (
+        'timed out', None)
+    run_path.write_text('\n')
+    assert run_automation(automation_definition, batch_definition) == (
+        'done', 0)
+    assert run_automation(automation_definition, batch_definition, True) == (
+        'skipped', 0)
+
+
+def test_work_after_failure(tmp_path):
+    (tmp_path / 'automate.yml').write_text(
+        'crosscompute: 0.9.0\n'
+        'version: 0.1.0\n'
+        'output:\n'
+        '  variables:\n'
+        '    - id: y\n'
+        '      view: number\n'
+        '      path: y.txt\n'
+        'environment:\n'
+        '  variables:\n'
+        '    - id: CROSSCOMPUTE_TEST_MISSING\n'
+        'script:\n'
+        '  command: python run.py\n')
+    (tmp_path / 'run.py').write_text('\n')
+    automation = Automation.load(str(tmp_path))
+    automation_definition = automation.definitions[0]
+    runs_folder = str(tmp_path / 'runs')
+    run_registry = RunRegistry(runs_folder)
+    automation_queue = Queue()
+    for run_id in 'a', 'b':
+        run_registry.add(automation_definition['slug'], run_id)
+        automation_queue.put((automation_definition, {
+            'folder': join(runs_folder, run_id)}))
+    automation_queue.put(None)
+    automation.work(automation_queue)
+    assert [_['status'] for _ in run_registry.get_run_definitions(
+        automation_definition['slug'])] == ['failed', 'failed']
+
+
+def test_announce_changed_uris(tmp_path):
+    (tmp_path / 'automate.yml').write_text(
+        'crosscompute: 0.9.0\n'
+        'version: 0.1.0\n')
+    automation = Automation.load(str(tmp_path))
+    message_queue = Queue()
+    timestamp = automation._timestamp_object.value
+    automation._announce(message_queue, ['/a/x/b/y'])
+    assert automation._timestamp_object.value == timestamp
+    assert message_queue.get() == {'uris': ['/a/x/b/y']}
+    automation._announce(message_queue)
+    assert automation._timestamp_object.value > timestamp
+    assert message_queue.get() == {'t': automation._timestamp_object.value}
+
+
+def test_run_function_with_noisy_import(tmp_path):
+    (tmp_path / 'automate.yml').write_text(
+        'crosscompute: 0.9.0\n'
+        'version: 0.1.0\n'
+        'output:\n'
+        '  variables:\n'
+        '    - id: y\n'
+        '      view: number\n'
+        '      path: y.txt\n'
+        'batches:\n'
+        '  - folder: batches/standard\n'
+        'script:\n'
+        '  function: run.plot\n'
+        '  imports:\n'
+        '    - noisy\n')
+    (tmp_path / 'noisy.py').write_text("print('imported noisy')\n")
+    (tmp_path / 'run.py').write_text(
+        "print('imported run')\n"
+        'def plot(input_folder, output_folder, log_folder, debug_folder):\n'
+        "    print('plotted')\n"
+        "    open(output_folder + '/y.txt', 'wt').write('1')\n")
+    automation_definition = Automation.load(str(tmp_path)).definitions[0]
+    batch_definition = automation_definition['batches'][0]
+    for _ in range(2):
+        assert run_automation(automation_definition, batch_definition) == (
+            'done', 0)
+    batch_folder = tmp_path / 'batches' / 'standard'
+    assert (batch_folder / 'debug' / 'stdout.txt').read_text() == 'plotted\n'
@@ -0,0 +1,71 @@
+import pickle
+import sys
+from os import utime
+
+from crosscompute.constants import CONFIGURATION_CACHE
+from crosscompute.routines.configuration import (
+    BatchDefinitions, CsvBatchDefinitions, compile_template,
+    get_raw_configuration)
+
+
+def test_get_raw_configuration_pickle(tmp_path, monkeypatch):
+    monkeypatch.setattr(sys, 'dont_write_bytecode', False)
+    path = tmp_path / 'automate.yml'
+    cache_path = tmp_path / '__pycache__' / 'automate.yml.pickle'
+
+    def load():
+        CONFIGURATION_CACHE.clear()
+        return get_raw_configuration(str(path))
+
+    path.write_text('a: 1\n')
+    assert load() == {'a': 1}
+    header = cache_path.read_bytes().splitlines(keepends=True)[0]
+    cache_path.write_bytes(header + pickle.dumps({'a': 'pickle'}))
+    assert load() == {'a': 'pickle'}
+    path.write_text('a: 22\n')
+    assert load() == {'a': 22}
+    cache_path.write_bytes(cache_path.read_bytes().replace(
+        pickle.dumps({'a': 22}), pickle.dumps({'a': 'pickle'})))
+    assert load() == {'a': 'pickle'}
+    path_stat = path.stat()
+    path.write_text('a: 33\n')
+    utime(path, ns=(path_stat.st_atime_ns, path_stat.st_mtime_ns + 1000))
+    assert load() == {'a': 33}
+    cache_path.write_bytes(b'[]\n' + b'not a pickle')
+    assert load() == {'a': 33}
+
+
+def test_csv_batch_definitions_skip_invalid_rows(tmp_path):
+    path = tmp_path / 'batches.csv'
+    path.write_text('x,#\n1,\nz,\n2,#\n3,\n\n4')
+    csv_batch_definitions = CsvBatchDefinitions(str(path), {
+        'folder': 'batches/{x}', 'name': '{x}', 'slug': '',
+    }, [{
+        'id': 'x', 'view': 'number', 'path': 'x.txt', 'mode': 'input'}])
+    batch_definitions = BatchDefinitions([csv_batch_definitions])
+    assert len(batch_definitions) == 3
+    assert [_['name'] for _ in batch_definitions] == ['1', '3', '4']
+    assert [_['name'] for _ in batch_definitions[:]] == ['1', '3', '4']
+    assert batch_definitions.find('4')['folder'] == 'batches/4'
+    batch_count, page = batch_definitions.search(offset=2, limit=2)
+    assert batch_count == 3
+    assert [_['name'] for _ in page] == ['4']
+    batch_count, page = batch_definitions.search(sort_key='-name')
+    assert [_['name'] for _ in page] == ['4', '3', '1']
+
+
+def test_compile_template():
+    assert compile_template('plain') == ['plain']
+    assert compile_template('{ x }') == [{
+        'id': 'x', 'function_names': [], 'text': '{ x }',
+        'is_paragraph': False}]
+    template_parts = compile_template(
+        '# Title\n\n{x}\n\nSum is {y | round} here.')
+    assert template_parts == [
+        '<h1>Title</h1>\n', {
+            'id': 'x', 'function_names': [], 'text': '{x}',
+            'is_paragraph': True},
+        '\n<p>Sum is ', {
+            'id': 'y', 'function_names': [' round'], 'text': '{y | round}',
+            'is_paragraph': False},
+        ' here.</p>']
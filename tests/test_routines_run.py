@@ -0,0 +1,76 @@
+from itertools import count
+from os import makedirs, utime
+from os.path import exists, join
+
+from crosscompute.routines import run
+from crosscompute.routines.run import RunRegistry, clean_runs
+
+
+def test_run_registry(tmp_path, monkeypatch):
+    monkeypatch.setattr(run, 'time', count(1).__next__)
+    run_registry = RunRegistry(str(tmp_path / 'runs'))
+    assert run_registry.get_run_definitions('x') == []
+    assert run_registry.count_runs('x') == 0
+    assert not exists(run_registry.path)
+    for run_id in 'b_1', 'a%1', 'c11':
+        assert run_registry.add('x', run_id, 'h')
+    assert run_registry.add('y', 'd', 'h')
+    run_registry.set_status('b_1', 'done', 0, 1.5)
+
+    # Keep a registered run as it is and refresh it only on a cache hit
+    assert not run_registry.add('x', 'b_1', 'h', status='failed')
+    assert not run_registry.requeue('b_1')
+    run_registry.touch('b_1')
+    run_definition = run_registry.get_run_definition('x', 'b_1')
+    assert run_definition['status'] == 'done'
+    assert run_definition['return_code'] == 0
+    assert run_definition['creation_time'] == 1
+    assert run_definition['update_time'] == 8
+    assert run_registry.get_run_definition('y', 'b_1') is None
+
+    # Queue a failed run again only once
+    run_registry.set_status('d', 'timed out')
+    assert run_registry.requeue('d')
+    assert not run_registry.requeue('d')
+    assert run_registry.get_run_definition('y', 'd')['status'] == 'queued'
+
+    def get_run_ids(**kw):
+        return [_['id'] for _ in run_registry.get_run_definitions('x', **kw)]
+
+    assert get_run_ids() == ['c11', 'a%1', 'b_1']
+    assert get_run_ids(sort_key='-time') == ['c11', 'a%1', 'b_1']
+    assert get_run_ids(sort_key='time') == ['b_1', 'a%1', 'c11']
+    assert get_run_ids(sort_key='name') == ['a%1', 'b_1', 'c11']
+    assert get_run_ids(sort_key='-name') == ['c11', 'b_1', 'a%1']
+    assert get_run_ids(sort_key='name', offset=1, limit=1) == ['b_1']
+    assert get_run_ids(sort_key='name', offset=2) == ['c11']
+
+    # Match percent and underscore literally
+    assert get_run_ids(text='%') == ['a%1']
+    assert get_run_ids(text='_') == ['b_1']
+    assert get_run_ids(text='1') == ['c11', 'a%1', 'b_1']
+    assert run_registry.count_runs('x') == 3
+    assert run_registry.count_runs('x', '_') == 1
+    assert run_registry.count_runs('x', 'z') == 0
+
+
+def test_clean_runs_keeps_active_runs(tmp_path):
+    runs_folder = str(tmp_path / 'runs')
+    run_registry = RunRegistry(runs_folder)
+    for run_id, status in [
+            ('a', 'done'), ('b', 'queued'), ('c', 'running'),
+            ('d', 'failed')]:
+        makedirs(join(runs_folder, run_id))
+        utime(join(runs_folder, run_id), (0, 0))
+        run_registry.add('x', run_id)
+        run_registry.set_status(run_id, status)
+    removed_folders = clean_runs({
+        'folder': str(tmp_path),
+        'script': {'cache': {'maximum_age_in_seconds': 60}},
+    })
+    assert sorted(removed_folders) == [
+        join(runs_folder, 'a'), join(runs_folder, 'd')]
+    assert exists(join(runs_folder, 'b'))
+    assert exists(join(runs_folder, 'c'))
+    assert [_['id'] for _ in run_registry.get_run_definitions(
+        'x', sort_key='name')] == ['b', 'c']
@@ -0,0 +1,35 @@
+from crosscompute.exceptions import CrossComputeDataError
+from crosscompute.routines.variable import (
+    NumberView, StringView, parse_data_by_id_by_column)
+
+
+class CodeView(StringView):
+
+    view_name = 'code'
+
+    def parse(self, data):
+        if not data.isalpha():
+            raise CrossComputeDataError(f'{data} is not a code')
+        return data.upper()
+
+
+def test_parse_data_by_id_by_column():
+    x_view = NumberView({
+        'id': 'x', 'view': 'number', 'path': 'x.txt', 'mode': 'input'})
+    c_view = CodeView({
+        'id': 'c', 'view': 'code', 'path': 'c.txt', 'mode': 'input'})
+    y_view = NumberView({
+        'id': 'y', 'view': 'number', 'path': 'y.txt', 'mode': 'input'})
+    keys = ['x', 'c']
+    rows = [['1', 'ab'], ['2.5'], ['z', 'cd'], ['3', '4']]
+    data_by_ids, error_by_index = parse_data_by_id_by_column(
+        keys, rows, [x_view, c_view])
+    assert data_by_ids[0] == {'x': 1, 'c': 'AB'}
+    assert data_by_ids[1]['x'] == 2.5
+    assert error_by_index == {
+        1: 'c required',
+        2: 'z is not a number for variable x',
+        3: '4 is not a code for variable c'}
+    data_by_ids, error_by_index = parse_data_by_id_by_column(
+        keys, rows, [x_view, y_view])
+    assert error_by_index == dict.fromkeys(range(4), 'y required')
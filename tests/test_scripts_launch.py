@@ -0,0 +1,15 @@
+import subprocess
+import sys
+
+
+def test_launch_imports_without_server_dependencies():
+    completed_process = subprocess.run([
+        sys.executable, '-X', 'importtime', '-c',
+        'import crosscompute.scripts.launch',
+    ], capture_output=True, text=True, check=True)
+    module_names = {
+        _.split('|')[-1].strip() for _ in completed_process.stderr.splitlines()
+        if _.startswith('import time:')}
+    assert 'crosscompute.scripts.launch' in module_names
+    for module_name in 'pyramid', 'waitress', 'markdown':
+        assert module_name not in module_names